@@ -68,10 +68,7 @@ async def reset_dut(clock, rst_n, cycles):
 
 # Configurations coro
 async def cfg_fifo(apb_drv: APBMasterDriver, clock):
-    af_th_wr_trns = APBTransaction('apb_fifo_rgf_cfg_cfg_af_th', rgf_dict, 6, True)
-    ae_th_wr_trns = APBTransaction('apb_fifo_rgf_cfg_cfg_ae_th', rgf_dict, 2, True)
-    await apb_drv._driver_send(af_th_wr_trns)
-    await apb_drv._driver_send(ae_th_wr_trns)
+    await apb_drv.write_fields({'apb_fifo_rgf_cfg_cfg_af_th': 6, 'apb_fifo_rgf_cfg_cfg_ae_th': 2})
     await ClockCycles(clock, 4)
 
 # Drive random data
@@ -90,13 +87,8 @@ async def read_sts(apb_drv: APBMasterDriver, clock):
     # status field names definitions
     status_fields = ['apb_fifo_rgf_sts_sts_full', 'apb_fifo_rgf_sts_sts_af', 'apb_fifo_rgf_sts_sts_ae', 'apb_fifo_rgf_sts_sts_empty', 'apb_fifo_rgf_cnt_sts_count']
     
-    # post requests to read all status fields
-    for fld in status_fields:
-        trns = APBTransaction(fld, rgf_dict, None, False)
-        await apb_drv._driver_send(trns)
-    
-    # wait for all requests to be over
-    await ClockCycles(clock, 10)
+    # read all status fields, fields sharing a register are read in a single transfer
+    await apb_drv.read_fields(status_fields)
 
 # Read data out fields
 async def read_dat(apb_drv: APBMasterDriver, clock):
@@ -113,8 +105,8 @@ async def basic_test(dut):
     await cocotb.start(Clock(dut.clk, 1, 'ns').start())
 
     # Define Driver and Monitor
-    apb_drv = APBMasterDriver(dut, 'rgf', dut.clk)
-    apb_mon = APBMonitor(dut, 'rgf', dut.clk, rgf_dict, bus_width=32)
+    apb_drv = APBMasterDriver(dut, 'rgf', dut.clk, rgf_dict=rgf_dict)
+    apb_mon = APBMonitor(dut, 'rgf', dut.clk, rgf_dict, bus_width=32, edge_filter=True)
     apb_mon.add_callback(print_transaction)
     apb_mon.add_callback(check_sts) # callback to compare between expected statuses and statuses read over APB
     apb_mon.add_callback(check_dat) # callback to compare between expected output data and received data over APB
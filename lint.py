@@ -35,6 +35,7 @@ def parse_args():
     group2.add_argument('-b', '--block-name', type=str, action='store', dest='b', help='Block Location Option 2 - Block name        , not needed if you are within a block   , "show" to display options', required=False)
     # view name - a must
     parser.add_argument('-v', '--view', type=str, action='store', dest='view', help='Desired view, "show" to display options', required=False)
+    parser.add_argument('-j', '--jobs', type=int, action='store', dest='jobs', help='Number of parallel workers, defaults to 1', default=1)
 
     # get arguments
     args = parser.parse_args(None if sys.argv[1:] else ['-h'])
@@ -50,7 +51,7 @@ def parse_args():
     else:
         view = args.view
         
-    return cfg_path, view
+    return cfg_path, view, args.jobs
 
 def lint(workdir: Path, top_level_module: str, results_names: List, results_paths: List):
     # log file path
@@ -81,11 +82,11 @@ def lint(workdir: Path, top_level_module: str, results_names: List, results_path
 
 def main() -> None:
     # 0. Parse user arguments
-    cfg_path, view = parse_args()
+    cfg_path, view, jobs = parse_args()
     # 1. Get descriptor from configuraiton file
     ws_path, _, _, _, _, work_dir = gen_get_descriptor(cfg_path, view)
     # 2. Generate filelist
-    results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True, [], [])
+    results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True, [], [], jobs=jobs)
     # 3. Find top-level-module
     top_level_module = get_top_level_path(cfg_path, view).stem
     # 4. Lint 
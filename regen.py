@@ -1,7 +1,6 @@
 import json
 from pathlib import Path
 from typing import List, Tuple
-import subprocess
 import argparse
 import sys
 import os
@@ -14,6 +13,7 @@ from utils.general import gen_show_ws
 from utils.cfgparse import show_views
 from utils.cfgparse import get_top_rgf_path
 from utils.cfgparse import get_top_level_path
+from utils.rgfgen import write_rgf_outputs
 
 # parse flags:
 def parse_args():
@@ -37,6 +37,8 @@ def parse_args():
     # output directory
     parser.add_argument('-o', '--out-dir', type=str, action='store', dest='out', help='Output directory for verilog or HTML files', required=False)
     parser.add_argument('-a', '--append', action='store_true', dest='a', help='If set, instance will be appended to top-level-module. Otherwise it will be in a new file in --out-dir', required=False)
+    parser.add_argument('--isolate', action='store_true', dest='isolate', help='Generate the RGF in a separate python process instead of in-process', required=False)
+    parser.add_argument('--no-cache', action='store_true', dest='nocache', help='Regenerate all outputs instead of reusing cached ones from $work_dir/regen_cache', required=False)
     
     # get arguments
     args = parser.parse_args(None if sys.argv[1:] else ['-h'])
@@ -56,69 +58,45 @@ def parse_args():
         out_dir = Path(args.out)
         out_dir.mkdir(parents=True, exist_ok=True)
         
-    return cfg_path, args.view, args.json, args.html, args.inst, args.verilog, out_dir, args.a
+    return cfg_path, args.view, args.json, args.html, args.inst, args.verilog, out_dir, args.a, args.isolate, args.nocache
 
-def execute(rgf_path: Path, top_module_path: Path, json: bool, html: bool, inst: bool, verilog: bool, out_dir: Path, append: bool)->None:
+def execute(rgf_path: Path, top_module_path: Path, json: bool, html: bool, inst: bool, verilog: bool, out_dir: Path, append: bool, isolate: bool=False, cache: bool=True)->None:
         notes = []
         rgf_name = rgf_path.stem
-        
-        # read RGF description from file
-        with open(rgf_path, 'r') as rgf_file:
-            rgf_content = rgf_file.read()
+
+        # collect requested outputs: (kind, output file, write mode)
+        requests = []
     
         # 1. Append instance to top level module
         if inst:
             if append:
-                rgf_content += f'''
-inst = {rgf_name}.get_inst()
-with open('{top_module_path}', 'a') as top_module:
-    top_module.write(inst)'''
+                requests.append(('inst', top_module_path, 'a'))
                 notes.append(f'appended {rgf_name} instance to {top_module_path}')
             else:
                 out_file = out_dir / f'{rgf_name}_inst.v'
-                rgf_content += f'''
-inst = {rgf_name}.get_inst()
-with open('{out_file}', 'w') as instance_file:
-    instance_file.write(inst)'''
+                requests.append(('inst', out_file, 'w'))
                 notes.append(f'wrote {rgf_name} instance verilog code to {out_file}')
         
         # 2. Write verilog to out_dir
         if verilog:
             out_file = out_dir / f'{rgf_name}.v'
-            rgf_content += f'''
-verilog = {rgf_name}.get_verilog()
-with open('{out_file}', 'w') as verilog_file:
-    verilog_file.write(verilog)'''
+            requests.append(('verilog', out_file, 'w'))
             notes.append(f'wrote {rgf_name} verilog code to {out_file}')
         
         # 3. Write HTML to out_dir
         if html:
             out_file = out_dir / f'{rgf_name}.html'
-            rgf_content += f'''
-html = {rgf_name}.get_html()
-with open('{out_file}', 'w') as html_file:
-    html_file.write(html)'''
+            requests.append(('html', out_file, 'w'))
             notes.append(f'wrote {rgf_name} html to {out_file}')
         
         # 4. Write json to out_dir
         if json:
             out_file = out_dir / f'{rgf_name}.json'
-            rgf_content += f'''
-json_content = {rgf_name}.get_json()
-with open('{out_file}', 'w') as json_file:
-    json.dump(json_content, json_file, indent=4)'''
+            requests.append(('json', out_file, 'w'))
             notes.append(f'wrote {rgf_name} json to {out_file}')
             
-        # Write RGF content to temp.py
-        temp_path = Path('temp.py')
-        with open(temp_path, 'w') as temp_file:
-            temp_file.write(rgf_content)
-        
-        # Run temp.py
-        output = subprocess.run(['python3', f'{temp_path}'])
-        if output.returncode!=0:
-            gen_err(f'failed to run {temp_path}')
-        subprocess.run(['rm', f'{temp_path}'])
+        # Generate all requested outputs from a single load of the RGF description, reusing cached ones
+        write_rgf_outputs(rgf_path, requests, isolate, cache)
         
         # Output results to log
         for note in notes:
@@ -126,13 +104,13 @@ with open('{out_file}', 'w') as json_file:
 
 def main():
     # 0. parse arguments
-    cfg_path, view, json, html, inst, verilog, out_dir, append = parse_args()
+    cfg_path, view, json, html, inst, verilog, out_dir, append, isolate, nocache = parse_args()
     # 1. get top level module path
     top_module_path = get_top_level_path(cfg_path, view)
     # 2. get RGF path
     rgf_path = get_top_rgf_path(cfg_path, view)
     # 3. execute user request - html \ verilog \ append instance
-    execute(rgf_path, top_module_path, json, html, inst, verilog, out_dir, append)
+    execute(rgf_path, top_module_path, json, html, inst, verilog, out_dir, append, isolate, not nocache)
 
 if __name__ == '__main__':
     main()
@@ -1,6 +1,7 @@
 from collections import deque
+from typing import List
 import cocotb
-from cocotb.triggers import RisingEdge, ReadOnly
+from cocotb.triggers import RisingEdge, ReadOnly, Event
 from cocotb_bus.drivers import BusDriver
 from cocotb_bus.monitors import BusMonitor
 
@@ -42,40 +43,94 @@ def reg2fld(reg: int, offset: int, width: int)->int:
     fld = (reg>>offset) & mask
     return fld
 
+# Register map index, built once from the RGF json dictionary
+class RegisterMap(object):
+    '''
+        Register Map Class
+            * indexes the fields of an RGF json dictionary once
+            * name --> location and (address, strobe) --> field lookups are dictionary lookups
+            * a transfer covers every field whose strobe is a subset of the transfer's strobe, fields may share a byte lane
+    '''
+    def __init__(self, rgf_dict: dict, rgf_name: str='rgf'):
+        self.by_name = {} # field name --> (address, strobe, offset, width, strobe int)
+        self.by_loc = {} # (address, strobe int) --> (field name, offset, width)
+        self.by_addr = {} # address --> [(field name, offset, width, strobe int)]
+        self.by_transfer = {} # (address, strobe int) --> [(field name, offset, width)], filled on first lookup
+        for fld in rgf_dict[rgf_name]:
+            address = int(fld['address'], 16)
+            strobe_int = 0
+            for i, strb in enumerate(fld['strobe']):
+                strobe_int |= int(strb) << i
+            self.by_name[fld['name']] = (address, fld['strobe'], fld['offset'], fld['width'], strobe_int)
+            self.by_loc.setdefault((address, strobe_int), (fld['name'], fld['offset'], fld['width']))
+            self.by_addr.setdefault(address, []).append((fld['name'], fld['offset'], fld['width'], strobe_int))
+
+    # Get field's strobe and address out of a name
+    def fld2loc(self, fld_name: str):
+        if fld_name not in self.by_name:
+            raise FieldNotFoundError(field_name=fld_name)
+        address, strobe, offset, width, _ = self.by_name[fld_name]
+        return address, strobe, offset, width
+
+    # Get field's address, integer strobe, offset and width out of a name
+    def fld2loc_int(self, fld_name: str):
+        if fld_name not in self.by_name:
+            raise FieldNotFoundError(field_name=fld_name)
+        address, _, offset, width, strobe_int = self.by_name[fld_name]
+        return address, strobe_int, offset, width
+
+    # Get field's name from strobe+address pair
+    def loc2fld(self, paddr: int, pstrb: int):
+        key = (int(paddr), int(pstrb))
+        if key not in self.by_loc:
+            raise FieldNotFoundError(field_addr=hex(key[0]), field_strobe=bin(key[1]))
+        return self.by_loc[key]
+
+    # Get all fields covered by a strobe+address pair, a merged transfer or a shared byte lane may cover several fields
+    def loc2flds(self, paddr: int, pstrb: int):
+        key = (int(paddr), int(pstrb))
+        if key not in self.by_transfer:
+            flds = [(name, offset, width) for name, offset, width, strobe_int in self.by_addr.get(key[0], []) if strobe_int & ~key[1] == 0]
+            if not flds:
+                raise FieldNotFoundError(field_addr=hex(key[0]), field_strobe=bin(key[1]))
+            self.by_transfer[key] = flds
+        return self.by_transfer[key]
+
+# register maps of json dictionaries that were already indexed, keyed by dictionary id
+_register_maps = {}
+
+# Get the register map of an RGF json dictionary, the dictionary is indexed on first use
+def get_register_map(rgf, rgf_name: str='rgf') -> RegisterMap:
+    if isinstance(rgf, RegisterMap):
+        return rgf
+    key = (id(rgf), rgf_name)
+    if key not in _register_maps or _register_maps[key][0] is not rgf:
+        _register_maps[key] = (rgf, RegisterMap(rgf, rgf_name))
+    return _register_maps[key][1]
+
 # Get field's strobe and address out of a name
 def fld2loc(fld_name: str, rgf_dict: dict, rgf_name: str='rgf'):
-    for fld in rgf_dict[rgf_name]:
-        if fld['name'] == fld_name:
-            address, strobe, offset, width = fld['address'], fld['strobe'], fld['offset'], fld['width']
-            address = int(address, 16)
-            return address, strobe, offset, width
-    raise FieldNotFoundError(field_name=fld_name)
+    return get_register_map(rgf_dict, rgf_name).fld2loc(fld_name)
 
 # Get field's name from strobe+address pair
 def loc2fld(paddr: int, pstrb: int, bus_width: int, rgf_dict: dict, rgf_name: str='rgf'):
-    for fld in rgf_dict[rgf_name]:
-        strb_width = int(bus_width / 8)
-        binary_string = bin(pstrb)[2:]
-        padded_binary = binary_string.zfill(strb_width)
-        strobe = [bit == '1' for bit in padded_binary]
-        strobe = strobe[::-1]
-        address = hex(paddr)
-        if fld['address'] == address and fld['strobe']==strobe:
-            return fld['name'], fld['offset'], fld['width']
-    raise FieldNotFoundError(fld_addr=address, fld_strobe=strobe)
+    return get_register_map(rgf_dict, rgf_name).loc2fld(paddr, pstrb)
 
 # APB Transaction Class
 class APBTransaction(object):
     '''
         APB Transaction Class
             * gets field's full name + data if this is a write transaction
-            * Looks up the register dictionary to find the field's name
-            * Converts the field's name + address + strobe to a transaction
+            * Looks up the register map to find the field's address, strobe and offset
+            * Stores the strobe and the field's bit mask pre-packed as integers
             * Defines print, equal and other functions
     '''
+    __slots__ = ('field_name', 'reg_address', 'strobe_int', 'fld_mask', 'fld_offset', 'fld_width', 'write', 'reg_width', 'reg_data', 'fld_data', 'address_width', 'start_time')
+
     def __init__(self, field_name: str, rgf_dict: dict, fld_data: int=None, write: bool=False, bus_width: int=32, address_width: int=8):
         self.field_name = field_name
-        self.reg_address, self.reg_strobe, self.fld_offset, self.fld_width = fld2loc(field_name, rgf_dict)
+        self.reg_address, self.strobe_int, self.fld_offset, self.fld_width = get_register_map(rgf_dict).fld2loc_int(field_name)
+        self.fld_mask = ((1 << self.fld_width) - 1) << self.fld_offset
         self.write = write
         self.reg_width = bus_width
         if fld_data is not None:
@@ -86,15 +141,34 @@ class APBTransaction(object):
             self.fld_data = None
         self.address_width = address_width
         self.start_time = None
-        self.rgf_dict = rgf_dict
+
+    # build a register level transaction, used for merged field accesses and raw register writes
+    @classmethod
+    def from_register(cls, reg_address: int, strobe_int: int, fld_mask: int, reg_data: int=None, write: bool=False, field_name: str=None, bus_width: int=32, address_width: int=8):
+        transaction = cls.__new__(cls)
+        transaction.field_name = field_name
+        transaction.reg_address = reg_address
+        transaction.strobe_int = strobe_int
+        transaction.fld_mask = fld_mask
+        transaction.fld_offset = 0
+        transaction.fld_width = bus_width
+        transaction.write = write
+        transaction.reg_width = bus_width
+        transaction.reg_data = reg_data
+        transaction.fld_data = reg_data
+        transaction.address_width = address_width
+        transaction.start_time = None
+        return transaction
+
+    # strobe as a list of booleans, LSB first
+    @property
+    def reg_strobe(self):
+        return [bool((self.strobe_int >> i) & 1) for i in range(self.reg_width // 8)]
 
     # print transaction
     def print(self):
         direction_str = 'WRITE' if self.write else 'READ'
-        strobe_str = ''
-        for strb in self.reg_strobe:
-            strobe_str += str(int(strb))
-        strobe_str = strobe_str[::-1]
+        strobe_str = format(self.strobe_int, f'0{self.reg_width // 8}b')
 
         print('-'*120)
         print('APB Transaction - ', end='')
@@ -120,15 +194,7 @@ class APBTransaction(object):
     
     # override equal operator
     def __eq__(self, other):
-
-        # compare each field
-        fail = False
-        fail = fail or not (self.reg_address == other.reg_address)
-        fail = fail or not (self.write == other.write)
-        fail = fail or not (self.fld_data == other.fld_data)
-
-        # return response
-        return not fail
+        return (self.reg_address, self.write, self.fld_data) == (other.reg_address, other.write, other.fld_data)
     
     # override not-equal operator
     def __ne__(self, value):
@@ -139,61 +205,112 @@ class APBMonitor(BusMonitor):
     '''
         APB Monitor
             * listen to the APB bus for valid transactions
+            * with edge_filter=True the monitor sleeps on psel while the bus is idle and samples on clock edges only while psel is high
     '''
     # override BusMonitor's _signals attribute
     _signals = ['paddr', 'pprot', 'psel', 'penable', 'pwrite', 'pwdata', 'pstrb', 'pwakeup', 'pready', 'prdata', 'pslverr']
 
     # init monitor
-    def __init__(self, entity, name, clock, rgf_dict: dict, bus_width=32, reset=None, reset_n=None, callback=None, event=None, **kwargs):
-        super().__init__(entity, name, clock, reset, reset_n, callback, event, **kwargs)
+    def __init__(self, entity, name, clock, rgf_dict: dict, bus_width=32, reset=None, reset_n=None, callback=None, event=None, edge_filter: bool=False, **kwargs):
         self.clock = clock
         self.bus_width = bus_width
         self.rgf_dict = rgf_dict
+        self.rgf_map = get_register_map(rgf_dict)
+        self.edge_filter = edge_filter
+        super().__init__(entity, name, clock, reset, reset_n, callback, event, **kwargs)
+
+    # sample a completed transfer, all data handles are read once per transfer
+    def _sample_transfer(self, paddr, pstrb, pwrite, pwdata, prdata) -> None:
+        
+        # retrieve the address, strobe and either read or write data from the bus
+        write = bool(pwrite.value)
+        values = [paddr.value, pstrb.value, pwdata.value if write else prdata.value]
+
+        # unresolved (X/Z) transfers are logged and skipped instead of crashing the monitor
+        if not all(value.is_resolvable for value in values):
+            self.log.warning(f'unresolved {"write" if write else "read"} transfer, address {values[0]} strobe {values[1]} data {values[2]}')
+            return
+        address, strobe, reg_data = [int(value) for value in values]
+
+        # store a transaction object per field, merged transfers are split to their fields
+        start_time = cocotb.utils.get_sim_time('ns')
+        for fld_name, fld_offset, fld_width in self.rgf_map.loc2flds(address, strobe):
+            fld_data = reg2fld(reg_data, fld_offset, fld_width)
+            transaction = APBTransaction(fld_name, self.rgf_map, fld_data, write)
+            transaction.start_time = start_time
+
+            # signal to the callback
+            self._recv(transaction)
 
     # monitor main coro
     async def _monitor_recv(self):
+
+        # bus handles and triggers are looked up once
+        bus = self.bus
+        psel, penable, pready = bus.psel, bus.penable, bus.pready
+        paddr, pstrb, pwrite, pwdata, prdata = bus.paddr, bus.pstrb, bus.pwrite, bus.pwdata, bus.prdata
+        clock_edge = RisingEdge(self.clock)
+        psel_edge = RisingEdge(psel)
+        read_only = ReadOnly()
         
-        await RisingEdge(self.clock)
+        await clock_edge
         while True:
             
-            await ReadOnly()
+            await read_only
 
             # both slave and master are ready for transfer
-            if self.bus.psel.value and self.bus.penable.value and self.bus.pready.value:
-
-                # retrieve the data and strobe from the bus
-                address = self.bus.paddr.value
-                strobe = self.bus.pstrb.value
-
-                # get either read or write data                
-                write = True if self.bus.pwrite.value else False
-                reg_data = self.bus.pwdata.value if write else self.bus.prdata.value
-
-                # store the transaction object
-                fld_name, fld_offset, fld_width = loc2fld(address, strobe, self.bus_width, self.rgf_dict)
-                fld_data = reg2fld(reg_data, fld_offset, fld_width)
-                transaction = APBTransaction(fld_name, self.rgf_dict, fld_data, write)
-                transaction.start_time = cocotb.utils.get_sim_time('ns')
-
-                # signal to the callback
-                self._recv(transaction)
+            if psel.value and penable.value and pready.value:
+                self._sample_transfer(paddr, pstrb, pwrite, pwdata, prdata)
+            
+            # idle bus, sleep until the next transfer is selected
+            elif self.edge_filter and not psel.value:
+                await psel_edge
+                continue
 
             # begin next cycle
-            await RisingEdge(self.clock)
+            await clock_edge
             
+# APB Transaction Handle Class
+class APBTransactionHandle(object):
+    '''
+        APB Transaction Handle Class
+            * returned by the driver for every sent transaction
+            * awaiting the handle waits for the transfer to complete and returns the transaction
+    '''
+    __slots__ = ('transaction', 'event')
+
+    def __init__(self, transaction: APBTransaction):
+        self.transaction = transaction
+        self.event = Event()
+    
+    # whether the transfer has completed
+    @property
+    def done(self) -> bool:
+        return self.event.is_set()
+    
+    # mark the transfer as completed
+    def complete(self) -> None:
+        self.event.set()
+    
+    def __await__(self):
+        if not self.event.is_set():
+            yield from self.event.wait().__await__()
+        return self.transaction
+
 # APB Master Driver Class
 class APBMasterDriver(BusDriver):
     '''
         APB Master Driver Class
-            * new transactions are appended to a transaction queue
-            * if the transaction queue transitions from empty to not-empty, a _tx_pipe coro is forked
+            * new transactions are appended to a transaction queue, sending returns an awaitable APBTransactionHandle
+            * default mode: if the transaction queue transitions from empty to not-empty, a _tx_pipe coro is forked
+            * pipelined mode: a persistent _tx_loop coro is woken by an event and drives queued transfers back-to-back
     '''
     
     # override BusDriver's _signals attribute
     _signals = ['paddr', 'pprot', 'psel', 'penable', 'pwrite', 'pwdata', 'pstrb', 'pwakeup', 'pready', 'prdata', 'pslverr']
 
     # init
-    def __init__(self, entity, name, clock, **kwargs):
+    def __init__(self, entity, name, clock, pipelined: bool=False, rgf_dict: dict=None, bus_width: int=32, **kwargs):
         super().__init__(entity, name, clock, **kwargs)
         self.bus.penable.value = 0 
         self.bus.pwrite.value = 0 
@@ -204,7 +321,45 @@ class APBMasterDriver(BusDriver):
         self.tx_coro = None
         self.tx_q = deque()
         self.clock = clock
+        self.pipelined = pipelined
+        self.rgf_map = get_register_map(rgf_dict) if rgf_dict is not None else None
+        self.bus_width = bus_width
+        self.tx_event = Event()
+        if pipelined:
+            self.tx_coro = cocotb.start_soon(self._tx_loop())
+    
+    # drive the setup phase of a transaction
+    def _drive_setup(self, curr_tx: APBTransaction) -> None:
+        curr_tx.start_time = cocotb.utils.get_sim_time('ns')
+        self.bus.psel.value = 1 
+        self.bus.penable.value = 0 
+        self.bus.paddr.value = curr_tx.reg_address
+        self.bus.pwrite.value = 1 if curr_tx.write else 0
+        self.bus.pstrb.value = curr_tx.strobe_int
+        if curr_tx.write:
+            self.bus.pwdata.value = curr_tx.reg_data
+    
+    # sample the completed transfer of a transaction
+    def _sample(self, curr_tx: APBTransaction) -> None:
+        if not curr_tx.write:
+
+            # unresolved read data (X/Z) is logged and returned as None instead of crashing the driver
+            prdata = self.bus.prdata.value
+            if not prdata.is_resolvable:
+                self.log.warning(f'unresolved read data {prdata} for {curr_tx.field_name} at address {hex(curr_tx.reg_address)}')
+                curr_tx.reg_data = None
+                curr_tx.fld_data = None
+                return
+            curr_tx.reg_data = int(prdata)
+            curr_tx.fld_data = (curr_tx.reg_data & curr_tx.fld_mask) >> curr_tx.fld_offset
     
+    # reset the bus
+    def _drive_idle(self) -> None:
+        self.bus.pwdata.value = 0 
+        self.bus.pwrite.value = 0 
+        self.bus.psel.value = 0 
+        self.bus.penable.value = 0 
+
     # transmition pipeline
     async def _tx_pipe(self):
         
@@ -215,24 +370,9 @@ class APBMasterDriver(BusDriver):
             # setup phase
             if state=='SETUP':
 
-                # pop transaction
-                curr_tx = self.tx_q.popleft()
-                curr_tx.start_time = cocotb.utils.get_sim_time('ns')
-
-                # assign values
-                self.bus.psel.value = 1 
-                self.bus.paddr.value = curr_tx.reg_address
-                self.bus.pwrite.value = 1 if curr_tx.write else 0
-
-                # strobe logic
-                pstrb_int = 0
-                for i, pstrb_i in enumerate(curr_tx.reg_strobe):
-                    pstrb_int += pstrb_i << i
-                self.bus.pstrb.value = pstrb_int
-
-                # drive data bus
-                if curr_tx.write:
-                    self.bus.pwdata.value = curr_tx.reg_data
+                # pop transaction and assign values
+                curr_tx, curr_handle = self.tx_q.popleft()
+                self._drive_setup(curr_tx)
                 
                 # move to next state
                 state = 'ACCESS'
@@ -253,8 +393,8 @@ class APBMasterDriver(BusDriver):
                 if self.bus.pready.value == 1:
                     
                     # sample data
-                    if not curr_tx.write:
-                        curr_tx.reg_data = self.bus.prdata.value
+                    self._sample(curr_tx)
+                    curr_handle.complete()
 
                     # next state logic
                     if len(self.tx_q)==0:
@@ -266,15 +406,105 @@ class APBMasterDriver(BusDriver):
                     self.bus.penable.value = 0 
             
         # reset the bus
-        self.bus.pwdata.value = 0 
-        self.bus.pwrite.value = 0 
-        self.bus.psel.value = 0 
-        self.bus.penable.value = 0 
+        self._drive_idle()
+        self.tx_coro = None
     
-    # override _driver_send
-    async def _driver_send(self, transaction: APBTransaction, sync: bool=True):
-        
-        self.tx_q.append(transaction)
+    # persistent transmition loop for pipelined mode, transfers are issued back-to-back while the queue is not empty
+    async def _tx_loop(self):
+        while True:
+
+            # sleep until a transaction is sent
+            if len(self.tx_q)==0:
+                self._drive_idle()
+                self.tx_event.clear()
+                await self.tx_event.wait()
+            
+            # setup phase
+            curr_tx, curr_handle = self.tx_q.popleft()
+            self._drive_setup(curr_tx)
+            await RisingEdge(self.clock)
 
-        if not self.tx_coro:
+            # access phase, wait for the slave to be ready
+            self.bus.penable.value = 1 
+            await RisingEdge(self.clock)
+            while self.bus.pready.value != 1:
+                await RisingEdge(self.clock)
+            
+            # sample phase, next setup phase follows immediately
+            self._sample(curr_tx)
+            curr_handle.complete()
+    
+    # queue transactions and make sure they are being driven
+    def _queue(self, transactions: List[APBTransaction]) -> List[APBTransactionHandle]:
+        handles = []
+        for transaction in transactions:
+            handle = APBTransactionHandle(transaction)
+            self.tx_q.append((transaction, handle))
+            handles.append(handle)
+
+        if self.pipelined:
+            self.tx_event.set()
+        elif not self.tx_coro:
             self.tx_coro = cocotb.start_soon(self._tx_pipe())
+        
+        return handles
+
+    # override _driver_send
+    async def _driver_send(self, transaction: APBTransaction, sync: bool=True) -> APBTransactionHandle:
+        return self._queue([transaction])[0]
+    
+    # send a batch of transactions through a single queue update
+    async def send_batch(self, transactions: List[APBTransaction]) -> List[APBTransactionHandle]:
+        return self._queue(transactions)
+    
+    # group fields by register address: address --> [(field name, strobe int, offset, width)]
+    def _group_fields(self, fld_names) -> dict:
+        if self.rgf_map is None:
+            raise ValueError('field access requires the driver to be created with rgf_dict')
+        groups = {}
+        for fld_name in fld_names:
+            address, strobe_int, offset, width = self.rgf_map.fld2loc_int(fld_name)
+            groups.setdefault(address, []).append((fld_name, strobe_int, offset, width))
+        return groups
+
+    # write several fields, fields that share a register are merged into a single strobed transfer
+    async def write_fields(self, values: dict) -> List[APBTransactionHandle]:
+        transactions = []
+        for address, flds in self._group_fields(values.keys()).items():
+            strobe_int, fld_mask, reg_data = 0, 0, 0
+            for fld_name, fld_strobe, offset, width in flds:
+                strobe_int |= fld_strobe
+                fld_mask |= ((1 << width) - 1) << offset
+                reg_data |= fld2reg(self.bus_width, values[fld_name], offset, width)
+            field_name = ','.join(fld[0] for fld in flds)
+            transactions.append(APBTransaction.from_register(address, strobe_int, fld_mask, reg_data, True, field_name, self.bus_width))
+        return self._queue(transactions)
+    
+    # read several fields, fields that share a register are read in a single strobed transfer
+    # waits for all transfers to complete and returns a field name --> field value dictionary, unresolved (X/Z) reads return None
+    async def read_fields(self, fld_names: List[str]) -> dict:
+        groups = self._group_fields(fld_names)
+        transactions = []
+        for address, flds in groups.items():
+            strobe_int, fld_mask = 0, 0
+            for _, fld_strobe, offset, width in flds:
+                strobe_int |= fld_strobe
+                fld_mask |= ((1 << width) - 1) << offset
+            field_name = ','.join(fld[0] for fld in flds)
+            transactions.append(APBTransaction.from_register(address, strobe_int, fld_mask, None, False, field_name, self.bus_width))
+        handles = self._queue(transactions)
+        values = {}
+        for handle, flds in zip(handles, groups.values()):
+            transaction = await handle
+            for fld_name, _, offset, width in flds:
+                values[fld_name] = None if transaction.reg_data is None else reg2fld(transaction.reg_data, offset, width)
+        return values
+    
+    # write consecutive full registers starting at a byte address
+    async def write_block(self, address: int, words: List[int]) -> List[APBTransactionHandle]:
+        strobe_int = (1 << (self.bus_width // 8)) - 1
+        reg_mask = (1 << self.bus_width) - 1
+        transactions = []
+        for i, word in enumerate(words):
+            transactions.append(APBTransaction.from_register(address + i * (self.bus_width // 8), strobe_int, reg_mask, word & reg_mask, True, None, self.bus_width))
+        return self._queue(transactions)
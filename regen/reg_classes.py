@@ -1,7 +1,7 @@
 import json
 import os
+import re
 from pathlib import Path
-import numpy as np
 import math
 from typing import List, Tuple
 from utils.general import gen_err
@@ -29,10 +29,55 @@ def create_port(direction: str, width: int, rgf_name: str, reg_name: str, field_
 
     return module_port, instance_port
 
+# split a bitmask to contiguous runs of set bits, returns (offset, width) pairs from LSB to MSB
+def bitmask_runs(mask: int)->List[Tuple[int, int]]:
+    runs = []
+    while mask:
+        offset = (mask & -mask).bit_length() - 1
+        shifted = mask >> offset
+        width = (shifted ^ (shifted + 1)).bit_length() - 1
+        runs.append((offset, width))
+        mask &= ~(((1 << width) - 1) << offset)
+    return runs
+
 ###############
 ### Classes ###
 ###############
 
+class Template(object):
+    '''
+        Verilog template, read from disk once per process and split into literal text and placeholders
+        so that rendering substitutes all placeholders in a single pass
+    '''
+    _loaded = {} # template file name --> Template
+    _placeholder_re = re.compile(r'(\{[A-Z_]+\})')
+
+    def __init__(self, text: str):
+        self.parts = self._placeholder_re.split(text) # odd indices are placeholders
+    
+    @classmethod
+    def load(cls, name: str) -> 'Template':
+        if name not in cls._loaded:
+            template_path = Path(os.environ['tools_dir']) / 'regen' / name
+            with open(template_path, 'r') as template:
+                cls._loaded[name] = cls(template.read())
+        return cls._loaded[name]
+    
+    def render(self, values: dict) -> str:
+        parts = self.parts[:]
+        for i in range(1, len(parts), 2):
+            parts[i] = values.get(parts[i], parts[i])
+        return ''.join(parts)
+    
+    def iter_render(self, values: dict):
+        # like render, but yields chunks. values that are not strings are iterables of chunks
+        for i, part in enumerate(self.parts):
+            value = values.get(part, part) if i % 2 else part
+            if isinstance(value, str):
+                yield value
+            else:
+                yield from value
+
 class Address(object):
     def __init__(self, byte_address: int=0):
         self.byte_address = byte_address
@@ -111,11 +156,6 @@ class Field(object):
     
     def get_verilog_ff(self, regfile_name: str, register_name: str, register_address: Address, latch=False) -> str:
         
-        # read from template
-        template_path = Path(os.environ['tools_dir']) / 'regen' / 'register_template.v'
-        with open(template_path, 'r') as template:
-            ff = template.read()
-        
         # parse permissions
         sw_wr_per_str = permissions_to_bit_str(self.permissions.sw_wr)
         hw_wr_per_str = permissions_to_bit_str(self.permissions.hw_wr)
@@ -149,11 +189,8 @@ class Field(object):
             '{LATCH}': latch_str
         }
         
-        # go over dictionary, replacing all keys with values
-        for key, value in rep_dict.items():
-            ff= ff.replace(key, value)
-
-        return ff
+        # render template, replacing all keys with values
+        return Template.load('register_template.v').render(rep_dict)
     
     def validate_reset_val(self, reset_val) -> int:
         if reset_val > (2 ** (self.width) - 1):
@@ -250,7 +287,7 @@ class Register(object):
         self.width = width # register width in [bits]
         self.address = Address(0)
         self.fields = [] # list of fields in register
-        self.occupied_bmap = np.zeros(width) # bit-map of occupied bits
+        self.occupied_bmap = 0 # bit-map of occupied bits, bit i is set if bit i of the register is occupied
         for fd in fields:
             self.add_field(fd)
             
@@ -273,11 +310,13 @@ class Register(object):
             gen_err(f'field "{field.name}" already exists within register "{self.name}"')
 
         # handle field offset that was not set
+        register_mask = (1 << self.width) - 1
+        field_mask = (1 << field.width) - 1
         if not field.offset:
             found_empty_spot = False
-            for i in range(4): # assume that fields should be byte-aligned
+            for i in range(math.ceil(self.width / 8)): # assume that fields should be byte-aligned
                 inferred_offset = i*8
-                if 1 not in self.occupied_bmap[inferred_offset:inferred_offset+field.width]: # found an empty slot
+                if not (field_mask << inferred_offset) & register_mask & self.occupied_bmap: # found an empty slot
                     found_empty_spot = True
                     break
             if not found_empty_spot:
@@ -285,30 +324,32 @@ class Register(object):
             field.offset = inferred_offset
 
         # check location is vacant
-        field_location = np.zeros(self.width)
-        field_location[field.offset:field.offset+field.width] = 1 
-        double_booking_array = np.logical_and(field_location, self.occupied_bmap)
-        if 1 in double_booking_array:
-            gen_err(f"can't add field '{field.name}' to register '{self.name}'. following bits are already taken: {np.where(double_booking_array==1)[0]}")
+        field_location = (field_mask << field.offset) & register_mask
+        double_booking = field_location & self.occupied_bmap
+        if double_booking:
+            taken_bits = [i for i in range(self.width) if (double_booking >> i) & 1]
+            gen_err(f"can't add field '{field.name}' to register '{self.name}'. following bits are already taken: {taken_bits}")
 
         # if location is vacant, update bitmap and add field:
-        self.occupied_bmap = np.logical_or(field_location, self.occupied_bmap)
+        self.occupied_bmap |= field_location
         self.fields.append(field)
     
-    def get_verilog_ffs(self, regfile_name: str) -> str:
-        ffs = ''
-        master_wire_declaration = f'\nlogic [{self.width}-1:0] {regfile_name}_{self.name} ;\n'
+    def iter_verilog_ffs(self, regfile_name: str):
         master_wire_assignments = []
         for fld in self.fields:
-            ffs += fld.get_verilog_ff(regfile_name, self.name, self.address) + '\n\n'
-            master_wire_assignments.append(f'assign {regfile_name}_{self.name}[{fld.offset}+:{fld.width}] = {regfile_name}_{self.name}_{fld.name} ;')
-        for i, bit in enumerate(self.occupied_bmap):
-            if not bit:
-                master_wire_assignments.append(f'assign {regfile_name}_{self.name}[{i}] = 1\'b0 ;')
-        content = ffs + master_wire_declaration 
-        for assignment in master_wire_assignments:
-            content += assignment + '\n'
-        return content
+            yield fld.get_verilog_ff(regfile_name, self.name, self.address) + '\n\n'
+            master_wire_assignments.append(f'assign {regfile_name}_{self.name}[{fld.offset}+:{fld.width}] = {regfile_name}_{self.name}_{fld.name} ;\n')
+        unused_bits = ~self.occupied_bmap & ((1 << self.width) - 1)
+        for offset, width in bitmask_runs(unused_bits):
+            if width == 1:
+                master_wire_assignments.append(f'assign {regfile_name}_{self.name}[{offset}] = 1\'b0 ;\n')
+            else:
+                master_wire_assignments.append(f'assign {regfile_name}_{self.name}[{offset}+:{width}] = {width}\'b0 ;\n')
+        yield f'\nlogic [{self.width}-1:0] {regfile_name}_{self.name} ;\n'
+        yield ''.join(master_wire_assignments)
+
+    def get_verilog_ffs(self, regfile_name: str) -> str:
+        return ''.join(self.iter_verilog_ffs(regfile_name))
     
     def get_verilog_ports(self, regfile_name: str) -> List[str]:
         module_ports, instance_ports = [], []
@@ -504,41 +545,47 @@ class RegFile(object):
     
         return html
 
-    def get_verilog(self) -> str:
+    def iter_rgf_content(self):
+        for reg in self.registers:
+            yield from reg.iter_verilog_ffs(self.name)
+            yield '\n\n'
+
+    def iter_verilog(self):
         
-        # build RGF content and output multiplexer
-        rgf_content, output_mux, port_content = '', '', ''
+        # build output multiplexer and ports, RGF content is streamed register by register
+        output_mux, port_content = [], []
         for reg in self.registers:
-            rgf_content += reg.get_verilog_ffs(self.name) + '\n\n'
-            output_mux += f'ADD_W\'({reg.address.byte_address}): prdata = {self.name}_{reg.name} ;\n   '
+            output_mux.append(f'ADD_W\'({reg.address.byte_address}): prdata = {self.name}_{reg.name} ;\n   ')
         port_list, _ = self.get_verilog_ports()
         for port in port_list:
-            port_content += f'{port}\n   '
+            port_content.append(f'{port}\n   ')
         
-        # open template
-        template_path = Path(os.environ['tools_dir']) / 'regen' / 'rgf_template.v'
-        with open(template_path, 'r') as template:
-            rgf_verilog = template.read()
-
-        # replace key words
-        rgf_verilog = rgf_verilog.replace('{HW_RGF_PORTS}', port_content)
-        rgf_verilog = rgf_verilog.replace('{RGF_CONTENT}', rgf_content)
-        rgf_verilog = rgf_verilog.replace('{OUTPUT_MUX}', output_mux)
-        rgf_verilog = rgf_verilog.replace('{RGF_REG_WIDTH}', f'{self.rgf_reg_width}')
-        rgf_verilog = rgf_verilog.replace('{RGF_ADD_WIDTH}', f'{self.rgf_addr_width}')
-        rgf_verilog = rgf_verilog.replace('{RGF_NAME}', f'{self.name}')
+        # render template, replacing key words
+        yield from Template.load('rgf_template.v').iter_render({
+            '{HW_RGF_PORTS}': ''.join(port_content),
+            '{RGF_CONTENT}': self.iter_rgf_content(),
+            '{OUTPUT_MUX}': ''.join(output_mux),
+            '{RGF_REG_WIDTH}': f'{self.rgf_reg_width}',
+            '{RGF_ADD_WIDTH}': f'{self.rgf_addr_width}',
+            '{RGF_NAME}': f'{self.name}'
+        })
 
         # handle interrupts
-        intr_str = ''
+        intr_list = []
         for reg in self.registers:
             for fld in reg.fields:
                 if isinstance(fld, IntrField):
-                    intr_str += f'{self.name}_{reg.name}_{fld.name}_intr | '
-        intr_str = intr_str[:-2] + ';\n'
+                    intr_list.append(f'{self.name}_{reg.name}_{fld.name}_intr | ')
+        intr_str = ''.join(intr_list)[:-2] + ';\n'
 
-        rgf_verilog += f'\nassign {self.name}___intr = {intr_str}\n\nendmodule\n'
-        
-        return rgf_verilog
+        yield f'\nassign {self.name}___intr = {intr_str}\n\nendmodule\n'
+    
+    def write_verilog(self, fp) -> None:
+        for chunk in self.iter_verilog():
+            fp.write(chunk)
+    
+    def get_verilog(self) -> str:
+        return ''.join(self.iter_verilog())
     
     def get_inst(self) -> str:
 
@@ -547,13 +594,10 @@ class RegFile(object):
         for port in port_list:
             port_string += f'   {port}\n'
         
-        template_path = Path(os.environ['tools_dir']) / 'regen' / 'rgf_inst_template.v'
-        with open(template_path, 'r') as template:
-            inst = template.read()
-        
-        inst = inst.replace('{RGF_NAME}', f'{self.name}')
-        inst = inst.replace('{RGF_PORTS}', port_string)
-        return inst
+        return Template.load('rgf_inst_template.v').render({
+            '{RGF_NAME}': f'{self.name}',
+            '{RGF_PORTS}': port_string
+        })
     
     def get_json(self):
 
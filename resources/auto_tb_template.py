@@ -3,11 +3,13 @@ from cocotb.triggers import FallingEdge, Timer, RisingEdge
 from cocotb.clock import Clock
 import random
 import sys
+import json
+import os
 import cocotb
 from cocotb.clock import Clock
 import cocotb.regression
 import cocotb.utils
-from cocotb.triggers import RisingEdge
+from cocotb.triggers import RisingEdge, ReadOnly, Edge, First
 import logging
 from cocotb.log import SimTimeContextFilter, SimColourLogFormatter, SimLogFormatter
 
@@ -21,6 +23,18 @@ cocotb.logging.getLogger().handlers = [strm_hdlr, file_hdlr]
 
 work_dir = "{WORK_DIR}"
 iterations = int({ITERATIONS})
+seed = int({SEED})
+replay = {REPLAY}
+
+# stimulus record: per cycle input words in stimulus.bin, described by stimulus.json
+stimulus_path = work_dir + '/stimulus.bin'
+stimulus_meta_path = work_dir + '/stimulus.json'
+
+# first panic report
+panic_report_path = work_dir + '/panic.json'
+
+# number of stimulus cycles driven so far, updated by drive_loop
+cycle = 0
 
 # Port list reading
 def get_ports_lists():
@@ -61,43 +75,121 @@ async def drive_clocks(dut, clk_list):
     for clk in clk_list:
         cocotb.start_soon(Clock(dut._id(clk, extended=False), 1, units="ns").start())
 
+# Resolve port handles once
+def get_handles(dut, name_list):
+    return [dut._id(name, extended=False) for name in name_list]
+
 # Initialize inputs
-async def drive_inputs(dut, input_list, init=False):
-    for _input in input_list:
-        signal = dut._id(_input, extended=False)
-        if not init:
-            signal_width = len(signal)
-            signal_max_val = 2 ** signal_width - 1
-            dut._id(_input, extended=False).value = random.randint(0, signal_max_val) 
-        else:
-            dut._id(_input, extended=False).value = 0 
-
-# Assert panics
-async def assert_panics(dut, panic_list):
-    for panic in panic_list:
-        assert dut._id(panic, extended=False), f'Found panic signal named {panic} asserted high'
+def init_inputs(input_handles):
+    for handle in input_handles:
+        handle.value = 0
+
+# Check whether any panic is asserted, returns the name of the first asserted panic or None
+def get_panic(panic_handles, panic_list):
+    for handle, name in zip(panic_handles, panic_list):
+        value = handle.value
+        if value.is_resolvable and int(value):
+            return name
+    return None
+
+# Random stimulus batches, every batch is recorded to the stimulus file before it is driven
+def random_batches(input_list, widths, nbytes, batch_size):
+    random.seed(seed)
+    getrandbits = random.getrandbits
+    total_width = sum(widths)
+    with open(stimulus_meta_path, 'w') as file:
+        json.dump(dict(seed=seed, inputs=input_list, widths=widths, nbytes=nbytes), file)
+    with open(stimulus_path, 'wb') as file:
+        done = 0
+        while done < iterations:
+            batch = [getrandbits(total_width) if total_width else 0 for _ in range(min(batch_size, iterations - done))]
+            file.write(b''.join(word.to_bytes(nbytes, 'little') for word in batch))
+            file.flush()
+            yield batch
+            done += len(batch)
+
+# Recorded stimulus batches, up to the number of iterations
+def replay_batches(input_list, widths, nbytes, batch_size):
+    with open(stimulus_meta_path, 'r') as file:
+        meta = json.load(file)
+    assert meta['inputs']==input_list and meta['widths']==widths, f'recorded stimulus in {stimulus_path} does not match the inputs of the design'
+    with open(stimulus_path, 'rb') as file:
+        data = file.read()
+    cycles = min(iterations, len(data) // nbytes) if nbytes else iterations
+    logging.getLogger('cocotb').info(f'replaying {cycles} cycles of stimulus recorded with seed {meta["seed"]} from {stimulus_path}')
+    for start in range(0, cycles, batch_size):
+        stop = min(start + batch_size, cycles)
+        yield [int.from_bytes(data[i * nbytes:(i + 1) * nbytes], 'little') for i in range(start, stop)]
+
+# Random stimulus coroutine: drives all inputs every cycle
+# the values of all inputs are a single word per cycle, either random (and recorded) or replayed from a previous run
+async def drive_loop(clk, input_handles, input_list, batch_size=1024):
+    global cycle
+
+    # per input offset and mask within a cycle's word, computed once
+    fields, widths, total_width = [], [], 0
+    for handle in input_handles:
+        width = len(handle)
+        fields.append((handle, total_width, (1 << width) - 1))
+        widths.append(width)
+        total_width += width
+    nbytes = (total_width + 7) // 8
+    clk_edge = RisingEdge(clk)
+
+    # main loop
+    batches = replay_batches if replay else random_batches
+    for batch in batches(input_list, widths, nbytes, batch_size):
+        for word in batch:
+            for handle, offset, mask in fields:
+                handle.value = (word >> offset) & mask
+            await clk_edge
+            cycle += 1
+
+# Get a printable value of a handle
+def get_value_str(handle):
+    value = handle.value
+    return hex(int(value)) if value.is_resolvable else str(value)
+
+# Panic monitor coroutine: sleeps until any panic changes, fails the test on the first asserted panic
+# the failure report (cycle, panic name and input state) is logged and written to panic.json
+async def monitor_panics(panic_handles, panic_list, input_handles, input_list):
+    panic_edges = [Edge(handle) for handle in panic_handles]
+    while True:
+        await ReadOnly()
+        panic = get_panic(panic_handles, panic_list)
+        if panic:
+            inputs = {name: get_value_str(handle) for handle, name in zip(input_handles, input_list)}
+            with open(panic_report_path, 'w') as file:
+                json.dump(dict(panic=panic, cycle=cycle, seed=seed, replay=replay, inputs=inputs), file, indent=4)
+            inputs_str = ', '.join(f'{name}={val}' for name, val in inputs.items())
+            raise AssertionError(f'Found panic signal named {panic} asserted high at cycle {cycle} (seed {seed}), inputs: {inputs_str}. Report written to {panic_report_path}, use --replay --sim-time {cycle} to replay up to this cycle')
+        await First(*panic_edges)
 
 @cocotb.test()
 async def my_test(dut):
 
-    # 0. Read port lists
+    # 0. Read port lists and resolve handles
     clk_list, rst_list, input_list, output_list, panic_list = get_ports_lists()
+    input_handles = get_handles(dut, input_list)
+    panic_handles = get_handles(dut, panic_list)
+
+    # remove the panic report of a previous run
+    if os.path.exists(panic_report_path):
+        os.remove(panic_report_path)
 
     # 1. Initialize Clocks and Reset DUT:
     if clk_list:
         cocotb.start_soon(drive_clocks(dut, clk_list))
-        cocotb.start_soon(drive_inputs(dut, input_list, True))
+        init_inputs(input_handles)
         await reset_dut(dut, rst_list, clk_list[0])
 
-        # 2. Main Loop:
-        for _ in range(iterations):
-        
-            # 2.1 Drive Inputs
-            cocotb.start_soon(drive_inputs(dut, input_list, False))
-
-            # 2.2 Assert Panics
-            cocotb.start_soon(assert_panics(dut, panic_list))
+        # 2. Panic monitor: stops the test as soon as a panic is asserted
+        if panic_handles:
+            cocotb.start_soon(monitor_panics(panic_handles, panic_list, input_handles, input_list))
 
-            # 2.3 Wait
-            await RisingEdge(dut._id(clk_list[0], extended=False))
+        # 3. Main Loop: drive inputs
+        logging.getLogger('cocotb').info(f'random stimulus seed is {seed}' if not replay else 'replaying recorded stimulus')
+        await drive_loop(dut._id(clk_list[0], extended=False), input_handles, input_list)
 
+        # 4. Let a panic caused by the last cycle propagate to the monitor
+        await ReadOnly()
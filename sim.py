@@ -1,10 +1,17 @@
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Tuple, Dict
 import subprocess
 import argparse
 import sys
 import os
 import re
+import time
+import json
+import hashlib
+import random
+import traceback
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
 from utils.general import gen_err
 from utils.general import gen_note
 from utils.general import gen_validate_path
@@ -15,13 +22,29 @@ from utils.general import gen_show_proj
 from utils.general import gen_show_ws
 from utils.general import gen_show_blk
 from utils.general import gen_get_descriptor
+from utils.general import gen_write_if_changed
 from utils.getlist import getlist
 from utils.cfgparse import show_views
 from utils.cfgparse import get_views
 from utils.cfgparse import get_top_level_path
 from utils.moduleparser import get_if
+from utils.simbackend import get_backend
+from utils.simbackend import SIM_BACKENDS
+from utils.simbackend import WAVES_DUMP_MODULE
 from utils.git_funcs import show_repos
 
+# waves dump module and output names
+WAVES_DUMP_FILE = 'waves_dump.v'
+WAVES_NAME = 'dump.fst'
+
+# native smoke testbench names
+NATIVE_DIR = 'native'
+NATIVE_TOP = 'veri_env_native_top'
+NATIVE_PANIC_PREFIX = 'veri_env_panic_'
+
+# recorded stimulus of the automatic testbench
+STIMULUS_FILE = 'stimulus.bin'
+
 # parse flags:
 def parse_args():
 
@@ -38,10 +61,21 @@ def parse_args():
     parser.add_argument('-v', '--view', type=str, action='store', dest='view', help='Desired view, "show" to display options', required=False)
     # optional triggers
     parser.add_argument('--waves', action='store_true', dest='wave', help='Create waves', default=False)
+    parser.add_argument('--waves-from', type=str, action='store', dest='waves_from', help='Start recording waves at a given time, specified in [cycles] of the top level clock or with a ns/us/ms suffix, implies --waves', required=False)
+    parser.add_argument('--waves-to', type=str, action='store', dest='waves_to', help='Stop recording waves at a given time, specified in [cycles] of the top level clock or with a ns/us/ms suffix, implies --waves', required=False)
+    parser.add_argument('--waves-scope', type=str, nargs='+', action='store', dest='waves_scope', help='Record waves of the given hierarchies only, specified relative to the top level module (e.g. u_fifo.u_ctrl), implies --waves', required=False)
+    parser.add_argument('--waves-depth', type=int, action='store', dest='waves_depth', help='Number of hierarchy levels to record below each scope, 0 for all levels, implies --waves', default=None)
     parser.add_argument('--sim-time', type=int, action='store', dest='simtime', help='simulation time for automatically generated testbench, specified in [cycles]', default=(2**16))
+    parser.add_argument('--sim', type=str, action='store', dest='sim', choices=list(SIM_BACKENDS), help='Simulator backend, defaults to icarus', default='icarus')
+    parser.add_argument('--native', action='store_true', dest='native', help='Smoke mode, run the automatic testbench natively using a generated verilator C++ harness, see --sim-time', default=False)
+    parser.add_argument('--seed', type=int, action='store', dest='seed', help='Random seed, a random one is picked and reported if not specified. In regression mode, seeds of all runs are derived from it', default=None)
+    parser.add_argument('--replay', action='store_true', dest='replay', help='Automatic testbench only, replay the stimulus recorded by the previous run instead of random stimulus, see --sim-time', default=False)
     parser.add_argument('--no-coco', action='store_true', dest='nococo', help='compile only, no cocotb testbench', default=False)
     parser.add_argument('--run-all', action='store_true', dest='runall', help='Run all views, compile only', default=False)
     parser.add_argument('--test', action='store', type=str, dest='t', help='name of cocotb test to run, should be located under verification\\block\\tests\\TEST_NAME.py', required=False)
+    parser.add_argument('-j', '--jobs', type=int, action='store', dest='jobs', help='Number of parallel workers, defaults to 1. With --run-all, number of views simulated in parallel', default=1)
+    parser.add_argument('--regress', type=str, nargs='+', action='store', dest='regress', help='Regression mode, names or glob patterns of cocotb tests located under verification\\block\\tests, "*" for all tests', required=False)
+    parser.add_argument('--seeds', type=int, action='store', dest='seeds', help='Regression mode, number of random seeds every test is run with, defaults to 1', default=1)
     parser.add_argument('--sim-arg', type=str, nargs='*', help='Optional test arguments, use --sim-arg ARG1=VAL1 or --sim-arg ARG2 if the argument is a boolean trigger', dest='simargs', required=False)
     
     # get arguments
@@ -50,6 +84,28 @@ def parse_args():
     # find cfg path 
     cfg_path = gen_find_cfg_file(args.c, args.ws, args.p, args.b)
         
+    # waves options, any of them implies --waves
+    waves_opts = dict(scopes=args.waves_scope, depth=args.waves_depth or 0, start=args.waves_from, stop=args.waves_to)
+    waves = args.wave or any(val is not None for val in [args.waves_from, args.waves_to, args.waves_scope, args.waves_depth])
+    if args.waves_depth is not None and args.waves_depth < 0:
+        gen_err('--waves-depth must not be negative')
+
+    # replay checks
+    if args.replay and (args.native or args.regress or args.runall or args.nococo or args.t):
+        gen_err('--replay can not be combined with --native, --regress, --run-all, --no-coco or --test')
+
+    # native mode checks
+    if args.native and (args.regress or args.runall or args.nococo or args.t or waves):
+        gen_err('--native can not be combined with --regress, --run-all, --no-coco, --test or waves options')
+
+    # regression mode checks
+    if args.regress and (args.runall or args.nococo or args.t or waves):
+        gen_err('--regress can not be combined with --run-all, --no-coco, --test or --waves')
+    if args.seeds < 1:
+        gen_err('--seeds must be a positive number')
+    if args.jobs < 1:
+        gen_err('-j must be a positive number')
+
     # parse view name #
     if args.runall:
         view_list = get_views(cfg_path)
@@ -62,39 +118,64 @@ def parse_args():
         view_list = [args.view]
         nococo = args.nococo
         
-    return cfg_path, view_list, args.wave, args.simtime, nococo, args.t, args.simargs
+    return cfg_path, view_list, waves, waves_opts, args.simtime, nococo, args.t, args.simargs, args.jobs, args.regress, args.seeds, args.sim, args.native, args.seed, args.replay
+
+# Get the compile cache directory of a design: keyed on the simulator and its options, the filelist and the top level module
+# source changes are left to the makefile prerequisites, so editing a source recompiles in place instead of adding an entry
+def get_sim_build(work_dir: Path, top_level_module: str, sim: str='icarus', extra_sources: List[Path]=[], options: List[str]=[]) -> Path:
+    fl_path = Path(work_dir) / Path('design.fl')
+    gen_validate_path(fl_path, 'locate filelist during compile cache lookup', False)
+    with open(fl_path, 'r') as fl:
+        fl_list = [line.rstrip() for line in fl if line.strip()]
+    fl_list += [str(source) for source in extra_sources]
+    key = json.dumps([sim, top_level_module, options, fl_list], sort_keys=True)
+    return Path(os.environ['work_dir']) / 'sim_cache' / hashlib.sha256(key.encode()).hexdigest()
+
+# Compile a design into its compile cache directory, make's prerequisites decide whether the compiled design is up to date
+def _compile(work_dir: Path, sim_build: Path, sim: str='icarus') -> bool:
+    sim_target = get_backend(sim).sim_target
+    gen_note(f'updating compiled design in {sim_build}')
+    output = subprocess.run(['make', f'{sim_build}/{sim_target}'], cwd=work_dir)
+    return output.returncode==0
 
 # Generates a makefile
-def _make_make(work_dir: str, top_level_module: str, block_name: str, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
+# fl_path defaults to the filelist in work_dir, regression runs share the filelist of the view instead of copying it
+def _make_make(work_dir: str, top_level_module: str, block_name: str, results_names: List[str]=[], results_paths: List[str]=[], sim_build: Path=None, waves: bool=False, waves_dump: Path=None, waves_depth: int=0, sim: str='icarus', fl_path: Path=None) -> Tuple[List[str], List[str]]:
     
-    fl_path = Path(work_dir) / Path('design.fl')
+    backend = get_backend(sim)
+    fl_path = Path(fl_path) if fl_path else Path(work_dir) / Path('design.fl')
     make_path = Path(work_dir) / Path('makefile')
     gen_validate_path(fl_path, 'locate filelist during makefile creation', False)
     
     # read filelist
     with open(fl_path, 'r') as fl:
-        fl_list = fl.readlines()
+        fl_list = [line.rstrip() for line in fl if line.strip()]
     
-    # write makefile
-    with open(make_path, 'w') as makefile:
+    # makefile header
+    lines = ['# Makefile', '', '# Defaults', 'SIM ?= ' + backend.name, 'TOPLEVEL_LANG ?= verilog', '']
+
+    # makefile filelist, includes the defines file and generated RGFs
+    lines += ['VERILOG_SOURCES += ' + str(Path(file).as_posix()) for file in fl_list]
+
+    # compile prerequisites: every source file above, and the filelist itself
+    lines += ['CUSTOM_COMPILE_DEPS += ' + str(fl_path.as_posix())]
 
-        # makefile header
-        makefile.write('# Makefile\n\n# Defaults\n') 
-        makefile.write('SIM ?= icarus\n')
-        makefile.write('TOPLEVEL_LANG ?= verilog\n\n')
+    # simulator specific defines, arguments and waves setup
+    lines += backend.get_make_lines(waves, waves_dump, waves_depth)
 
-        # makefile filelist
-        for file in fl_list:
-            file_str = str(Path(file.rstrip()).as_posix())
-            makefile.write('VERILOG_SOURCES += ' + file_str + '\n')
+    # makefile footer
+    lines += ['', 'TOPLEVEL = ' + top_level_module, '', 'MODULE = ' + block_name + '_tb', '']
+    if sim_build:
+        lines += ['SIM_BUILD = ' + str(Path(sim_build).as_posix()), '']
+    lines += ['include $(shell cocotb-config --makefiles)/Makefile.sim']
 
-        # makefile footer
-        makefile.write('\nTOPLEVEL = ' + top_level_module + '\n\n')
-        makefile.write('MODULE = ' + block_name + '_tb\n\n')
-        makefile.write('include $(shell cocotb-config --makefiles)/Makefile.sim')
+    # write makefile, an unchanged makefile keeps its modification time
+    if gen_write_if_changed(make_path, '\n'.join(lines)):
+        gen_note(f'wrote makefile to {make_path}')
+    else:
+        gen_note(f'makefile in {make_path} is up to date')
     
-    # notify user
-    gen_note(f'wrote makefile to {make_path}')
+    # append output results
     results_names.append('makefile')
     results_paths.append(make_path)
 
@@ -231,7 +312,7 @@ def append_test(header: str, args_list: List[str], test_path: Path, test_name: s
     return result
 
 # Generates a generic testbench
-def _gen_tb(tb_dir: Path, work_dir: Path, block_name: str, simtime: int, test_name: str, sim_args: List[str], results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
+def _gen_tb(tb_dir: Path, work_dir: Path, block_name: str, simtime: int, test_name: str, sim_args: List[str], results_names: List[str]=[], results_paths: List[str]=[], seed: int=0, replay: bool=False) -> Tuple[List[str], List[str]]:
     
     # Paths to Testbenches
     homedir_tb_path = tb_dir / Path(block_name + '_tb.py') 
@@ -317,6 +398,10 @@ cocotb.logging.getLogger().handlers = [strm_hdlr, file_hdlr]\n'''
             tb_contents = file.read()
         tb_contents = tb_contents.replace('{WORK_DIR}', str(work_dir))
         tb_contents = tb_contents.replace('{ITERATIONS}', str(simtime))
+        tb_contents = tb_contents.replace('{SEED}', str(seed))
+        tb_contents = tb_contents.replace('{REPLAY}', str(replay))
+        if replay:
+            gen_validate_path(work_dir / STIMULUS_FILE, 'locate recorded stimulus for replay')
     
     # Get existing testbench from verification directory:
     else:
@@ -338,78 +423,228 @@ cocotb.logging.getLogger().handlers = [strm_hdlr, file_hdlr]\n'''
     
     return results_names, results_paths
 
-# Add 'dump vcd file' section in design:
-def _add_dump_vcd(work_dir: str, top_level_module: str) -> None:
-    
-    # validate filelist path
-    fl_path = Path(work_dir) / Path('design.fl')
-    gen_validate_path(fl_path, 'locate filelist during vcd dump process')
-    
-    # find top level path in filelist
-    with open(fl_path, 'r') as file_list:
-        for line in file_list:
-            if top_level_module in line:
-                top_level_path = Path(line.rstrip())
-    
-    # throw an error if top level module was not found
-    if not top_level_path.is_file():
-        gen_err(f'top level module not found in {top_level_path}')
-    
-    # read design to temp
-    with open(top_level_path, 'r') as design:
-        old = design.readlines() 
-    
-    # write old content to temporary file
-    temp_path = Path(str(top_level_path) + '.temp')
-    with open(temp_path, 'w') as origin:
-        for line in old:
-            origin.write(line)
-    gen_note(f'design temporarly backed up to {temp_path}')
-
-    # overwrite content with the design + a dump command
-    with open(top_level_path, 'w') as design:
-        for line in old:
-            if 'endmodule' in line:
-                design.write('\ninitial begin\n   $dumpfile(\"dump.vcd\");\n   $dumpvars(0, ' + top_level_module + ');\nend\nendmodule') 
-            else:
-                design.write(line)
-    gen_note(f'vcd dump command added to top-level module in {top_level_path}')
-        
-# Remove 'dump vcd file' section in design:
-def _rem_dump_vcd(work_dir: str, top_level_module: str) -> None:
-
-    # validate filelist path
-    fl_path = Path(work_dir) / Path('design.fl')
-    gen_validate_path(fl_path, 'locate filelist during vcd removal process')
-
-    # find top level path in filelist
-    with open(fl_path, 'r') as file_list:
-        for line in file_list:
-            if top_level_module in line:
-                top_level_path = Path(line.rstrip())
-    
-    # throw an error if top level module was not found
-    if not top_level_path.is_file():
-        gen_err(f'top level module not found in {top_level_path}')
-    
-    # validate original design backup path
-    top_level_origin_path = Path(str(top_level_path) + '.temp')
-    gen_validate_path(top_level_origin_path, 'locate backup design in dump removal process')
-
-    # read original design backup
-    with open(top_level_origin_path, 'r') as design:
-        old = design.readlines() 
-    
-    # write to original design location
-    with open(top_level_path, 'w') as design:
-        for line in old:
-            design.write(line)
-    
-    # remove temporary design
-    subprocess.run(['rm ' + str(top_level_origin_path)], shell=True)
+# Parse a waves time: a number of cycles, or a time with a ns/us/ms suffix. Returns the amount and unit, unit is None for cycles
+def _parse_waves_time(value: str) -> Tuple[float, str]:
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*(ns|us|ms|cycles)?\s*', value)
+    if not match:
+        gen_err(f'could not parse waves time {value}, expected a number of cycles or a time with a ns/us/ms suffix')
+    amount, unit = float(match.group(1)), match.group(2)
+    if unit in [None, 'cycles']:
+        if not amount.is_integer():
+            gen_err(f'waves time {value} must be a whole number of cycles')
+        return int(amount), None
+    return amount * {'ns': 1, 'us': 1e3, 'ms': 1e6}[unit], 'ns'
+
+# Get the top level clock, the first input port that contains the substring clk
+def _get_top_clock(rtl_dir: Path, top_level_module: str) -> str:
+    if_dict, _ = get_if(rtl_dir / Path(top_level_module + '.v'))
+    for dictionary in if_dict:
+        for i, name in enumerate(dictionary['names']):
+            if dictionary['directions'][i]=='input' and 'clk' in name:
+                return name
+    return None
+
+# Verilog statement that waits from time 0 to a parsed waves time
+# times are written in full precision, down to the 1ps precision of the dump module's timescale
+def _waves_wait(amount: float, unit: str, clock: str) -> str:
+    if unit:
+        return f'#{amount:.3f};'
+    return f'repeat ({amount}) @(posedge {clock});'
+
+# Generate a dump control module in the work directory, the design sources are never modified
+# scopes are hierarchical names under the top level module, start and stop are waves times (see _parse_waves_time)
+def _gen_waves_dump(work_dir: Path, top_level_module: str, rtl_dir: Path=None, scopes: List[str]=None, depth: int=0, start: str=None, stop: str=None) -> Path:
+    dump_path = Path(work_dir) / WAVES_DUMP_FILE
+    scopes = [f'{top_level_module}.{scope}' for scope in scopes] if scopes else [top_level_module]
+    start = _parse_waves_time(start) if start else None
+    stop = _parse_waves_time(stop) if stop else None
+
+    # cycle based windows are counted on the top level clock
+    clock = None
+    if (start and not start[1]) or (stop and not stop[1]):
+        clock = _get_top_clock(rtl_dir, top_level_module)
+        if not clock:
+            gen_err(f'waves window in cycles requires a clock input in {top_level_module}, use a ns/us/ms suffix instead')
+        clock = f'{top_level_module}.{clock}'
+    if start and stop and start[1]==stop[1] and stop[0] <= start[0]:
+        gen_err('--waves-to must be later than --waves-from')
+    
+    # dump the selected scopes, recording is turned on only within the requested window
+    lines = ['`timescale 1ns/1ps', f'module {WAVES_DUMP_MODULE}();', 'initial begin', f'   $dumpfile("{WAVES_NAME}");']
+    lines += [f'   $dumpvars({depth}, {scope});' for scope in scopes]
+    if start:
+        lines += ['   $dumpoff;', f'   {_waves_wait(*start, clock)}', '   $dumpon;']
+    lines += ['end']
+    if stop:
+        lines += ['initial begin', f'   {_waves_wait(*stop, clock)}', '   $dumpoff;', 'end']
+    lines += ['endmodule', '']
+    
+    # unchanged dump modules keep their modification time, so that the compiled design is reused
+    gen_write_if_changed(dump_path, '\n'.join(lines))
+    gen_note(f'waves dump module written to {dump_path}')
+    return dump_path
+
+# Read the port lists written by _get_sim_portlist
+def _read_portlists(work_dir: Path) -> Tuple[List[str], List[str], List[str], List[str], List[str]]:
+    portlists = []
+    for name in ['clks', 'resets', 'inputs', 'outputs', 'panics']:
+        with open(work_dir / 'port_description' / f'{name}.txt', 'r') as file:
+            portlists.append([line.rstrip('\n') for line in file if line.strip()])
+    return tuple(portlists)
+
+# split a verilog list on commas that are not enclosed in brackets
+def _split_top_level(text: str) -> List[str]:
+    items, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char==',' and depth==0:
+            items.append(text[start:i])
+            start = i + 1
+    return items + [text[start:]]
+
+# index of the bracket that closes the bracket at text[start]
+def _match_bracket(text: str, start: int) -> int:
+    depth = 0
+    for i in range(start, len(text)):
+        depth += {'(': 1, ')': -1}.get(text[i], 0)
+        if depth==0:
+            return i
+    return -1
+
+# evaluate a verilog constant expression, supports integer arithmetic, sized literals, int'() casts and $clog2
+def _eval_const(expr: str, consts: Dict[str, int]) -> int:
+    expr = re.sub(r"\d*'[sS]?([bBoOdDhH])([0-9a-fA-F_]+)", lambda m: str(int(m.group(2).replace('_', ''), {'b': 2, 'o': 8, 'd': 10, 'h': 16}[m.group(1).lower()])), expr)
+    expr = re.sub(r"\bint\s*'\s*\(", 'int(', expr).replace('$clog2', 'clog2').replace('/', '//')
+    names = dict(consts, int=int, clog2=lambda x: max(int(x) - 1, 0).bit_length())
+    return int(eval(expr, {'__builtins__': {}}, names))
+
+# Get the widths of the ports of an ANSI style module header, resolved with the default values of the module parameters
+# ports whose width can not be resolved are left out
+def _get_port_widths(src_path: Path, module_name: str) -> Dict[str, int]:
+    with open(src_path, 'r') as file:
+        text = re.sub(r'//[^\n]*|/\*.*?\*/', ' ', file.read(), flags=re.S)
+    match = re.search(r'\bmodule\s+' + re.escape(module_name) + r'\b\s*', text)
+    if not match:
+        return {}
+    pos = match.end()
+
+    # parameters, later parameters may depend on earlier ones
+    consts = {}
+    if text.startswith('#', pos):
+        open_pos = text.index('(', pos)
+        close_pos = _match_bracket(text, open_pos)
+        for item in _split_top_level(text[open_pos+1:close_pos]):
+            param = re.match(r'\s*(?:parameter\s+)?(?:\w+\s+)?(?:signed\s+)?(?:\[[^\]]*\]\s*)?(\w+)\s*=\s*(.+)', item, re.S)
+            try:
+                consts[param.group(1)] = _eval_const(param.group(2).strip(), consts)
+            except Exception:
+                continue
+        pos = close_pos + 1
+
+    # ports, a port without a direction shares the direction and ranges of the previous port
+    widths = {}
+    open_pos = text.find('(', pos)
+    if open_pos==-1:
+        return widths
+    ranges = ''
+    for item in _split_top_level(text[open_pos+1:_match_bracket(text, open_pos)]):
+        port = re.match(r'\s*(input|output|inout)?\s*(?:wire|logic|reg|bit)?\s*(?:signed|unsigned)?\s*((?:\[[^\]]*\]\s*)*)(\w+)\s*$', item)
+        if not port:
+            continue
+        if port.group(1):
+            ranges = port.group(2)
+        try:
+            width = 1
+            for msb, lsb in re.findall(r'\[([^:\]]+):([^\]]+)\]', ranges):
+                width *= abs(_eval_const(msb, consts) - _eval_const(lsb, consts)) + 1
+            widths[port.group(3)] = width
+        except Exception:
+            continue
+    return widths
+
+# C++ assignment of a value to a verilated port, ports above 64 bits are VlWide arrays of 32 bit words
+# random values are masked to the port width so that the model only sees clean inputs
+def _native_assign(name: str, width: int, random: bool, indent: str) -> str:
+    if width <= 64:
+        value = ('rng()' + (f' & 0x{(1 << width) - 1:X}ULL' if width < 64 else '')) if random else '0'
+        return f'{indent}top->{name} = {value};'
+    words = (width + 31) // 32
+    lines = [f'{indent}for (int i = 0; i < {words}; i++) top->{name}[i] = ' + ('(uint32_t)rng();' if random else '0;')]
+    if random and width % 32:
+        lines.append(f'{indent}top->{name}[{words - 1}] &= 0x{(1 << width % 32) - 1:X}U;')
+    return '\n'.join(lines)
+
+# Generate the native smoke testbench: a verilog wrapper with the real port widths and a C++ harness
+# widths are resolved from the top level header with its default parameters, panics are OR-ed to a single output
+def _gen_native(work_dir: Path, top_level_module: str, rtl_dir: Path) -> Tuple[Path, Path]:
+    clks, rsts, inputs, outputs, panics = _read_portlists(work_dir)
+    if not clks:
+        gen_err(f'native mode requires a clock input in {top_level_module}')
+    widths = _get_port_widths(rtl_dir / Path(top_level_module + '.v'), top_level_module)
+    unresolved = [name for name in inputs + panics if name not in widths]
+    if unresolved:
+        gen_err(f'native mode could not resolve the width of {unresolved} in {top_level_module}, ports must be declared in the module header with constant or parameter based ranges')
+    native_dir = work_dir / NATIVE_DIR
+    native_dir.mkdir(parents=True, exist_ok=True)
+
+    # wrapper
+    ranges = {name: f'[{widths[name] - 1}:0] ' if widths[name] > 1 else '' for name in inputs + panics}
+    ports = [f'   input {name}' for name in clks + rsts] + [f'   input {ranges[name]}{name}' for name in inputs] + ['   output veri_env_panic']
+    conns = [f'      .{name}({name})' for name in clks + rsts + inputs] + [f'      .{name}({NATIVE_PANIC_PREFIX}{name})' for name in panics]
+    conns += [f'      .{name}()' for name in outputs]
+    lines = [f'module {NATIVE_TOP} (', ',\n'.join(ports), ');']
+    lines += [f'   wire {ranges[name]}{NATIVE_PANIC_PREFIX}{name};' for name in panics]
+    lines += [f'   {top_level_module} u_dut (', ',\n'.join(conns), '   );']
+    panic_expr = ' | '.join(f'(|{NATIVE_PANIC_PREFIX}{name})' for name in panics) if panics else "1'b0"
+    lines += [f'   assign veri_env_panic = {panic_expr};', 'endmodule', '']
+    wrapper_path = native_dir / f'{NATIVE_TOP}.v'
+    gen_write_if_changed(wrapper_path, '\n'.join(lines))
+    
+    # harness
+    with open(Path(os.environ['tools_dir']) / 'resources' / 'native_tb_template.cpp', 'r') as file:
+        harness = file.read()
+    replacements = {
+        '{NATIVE_TOP}': NATIVE_TOP,
+        '{CLOCKS_LOW}': '\n'.join(f'    top->{name} = 0;' for name in clks),
+        '{CLOCKS_HIGH}': '\n'.join(f'    top->{name} = 1;' for name in clks),
+        '{INPUTS_INIT}': '\n'.join(_native_assign(name, widths[name], False, '    ') for name in inputs),
+        '{RESETS_ASSERT}': '\n'.join(f'    top->{name} = 0;' for name in rsts),
+        '{RESETS_RELEASE}': '\n'.join(f'    top->{name} = 1;' for name in rsts),
+        '{INPUTS_DRIVE}': '\n'.join(_native_assign(name, widths[name], True, '        ') for name in inputs),
+    }
+    for key, val in replacements.items():
+        harness = harness.replace(key, val)
+    harness_path = native_dir / f'{NATIVE_TOP}.cpp'
+    gen_write_if_changed(harness_path, harness)
+
+    gen_note(f'native testbench written to {native_dir}')
+    return wrapper_path, harness_path
+
+# Build and run the native smoke testbench, verilator rebuilds changed objects only
+def _run_native(work_dir: Path, wrapper_path: Path, harness_path: Path, simtime: int, seed: int, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str], bool]:
+    native_dir = work_dir / NATIVE_DIR
+    fl_path = work_dir / Path('design.fl')
+    gen_validate_path(fl_path, 'locate filelist for native compilation', False)
+    
+    # build
+    gen_note(f'building native testbench in {native_dir}')
+    command = ['verilator', '--cc', '--exe', '--build', '-O3', '-Wno-fatal', '-Wno-WIDTH', '--timescale', '1ns/1ps', f'-D{get_backend("verilator").get_define()}']
+    command += ['--top-module', NATIVE_TOP, '-Mdir', str(native_dir), '-o', NATIVE_TOP, '-f', str(fl_path), str(wrapper_path), str(harness_path)]
+    output = subprocess.run(command)
+    results_names.append('native testbench')
+    results_paths.append(harness_path)
+    if output.returncode!=0:
+        return results_names, results_paths, True
+
+    # run, cycles and seed are plusargs so that the harness is not rebuilt when they change
+    output = subprocess.run([str(native_dir / NATIVE_TOP), f'+seed={seed}', f'+cycles={simtime}'], cwd=work_dir)
+    return results_names, results_paths, output.returncode!=0
 
 # Run make or iverilog command on shell 
-def _run(work_dir: Path, top_level_module: str, nococo: bool=False, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
+def _run(work_dir: Path, top_level_module: str, nococo: bool=False, results_names: List[str]=[], results_paths: List[str]=[], sim: str='icarus', seed: int=None) -> Tuple[List[str], List[str]]:
 
     # store current directory in temp
     current_dir = os.getcwd()
@@ -423,9 +658,9 @@ def _run(work_dir: Path, top_level_module: str, nococo: bool=False, results_name
         fl_path = Path(work_dir) / Path('design.fl')
         gen_validate_path(fl_path, 'locate filelist for compilation', False)
         
-        # run command on shell
-        command = 'iverilog -s ' + top_level_module + ' -o ' + top_level_module + '_compile_results -c ' + str(fl_path) + ' -g2012'
-        output = subprocess.run([command], shell=True)
+        # run the simulator's compile command
+        command = get_backend(sim).get_compile_command(fl_path, top_level_module, Path(f'{work_dir}/{top_level_module}_compile_results'))
+        output = subprocess.run(command)
         
         # append outputs to result list
         results_names.append('compilation output')
@@ -437,7 +672,8 @@ def _run(work_dir: Path, top_level_module: str, nococo: bool=False, results_name
         makefile_path = work_dir / Path('makefile')
         gen_validate_path(makefile_path, f'locate makefile in {makefile_path}')
         gen_note(f'running makefile in {makefile_path}')
-        output = subprocess.run(['make'], shell=True)
+        env = dict(os.environ, RANDOM_SEED=str(seed)) if seed is not None else None
+        output = subprocess.run(['make'], shell=True, env=env)
 
         # append output results
         results_names.append('simulation output')
@@ -453,46 +689,252 @@ def _run(work_dir: Path, top_level_module: str, nococo: bool=False, results_name
 
 # open GTKWave
 def _wave(work_dir: str, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
-    found_vcd = False
-    for child in Path(work_dir).iterdir():
-        if child.is_file() and child.suffix=='.vcd':
-            if found_vcd:
-                gen_note('found more than one .vcd file in folder, took the first ignored the rest')
-            else:
-                found_vcd = True
-                vcd_path = child
-    if found_vcd:
-        gen_note(f'opening vcd file in {vcd_path} using GTKWave')
-        subprocess.run(['gtkwave', vcd_path, '&'])
-        results_names.append('vcd dump')
-        results_paths.append(Path(vcd_path))
-        return results_names, results_paths
-    else:
-        gen_err('no vcd files found')
+    waves_path = Path(work_dir) / WAVES_NAME
+    if not waves_path.is_file():
+        gen_err(f'no waves found in {waves_path}')
+    gen_note(f'opening waves in {waves_path} using GTKWave')
+    subprocess.Popen(['gtkwave', str(waves_path)])
+    results_names.append('waves dump')
+    results_paths.append(waves_path)
+    return results_names, results_paths
 
 # create test files: makefile and testbench
-def create_test(tb_dir: Path, work_dir: Path, top_level_module: str, rtl_dir: Path, block_name: str, simtime: int, test_name: str, sim_args: List[str], results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
-    results_names, results_paths = _make_make(work_dir, top_level_module, block_name, results_names, results_paths)
-    results_names, results_paths = _gen_tb(tb_dir, work_dir, block_name, simtime, test_name, sim_args, results_names, results_paths)
+def create_test(tb_dir: Path, work_dir: Path, top_level_module: str, rtl_dir: Path, block_name: str, simtime: int, test_name: str, sim_args: List[str], results_names: List[str]=[], results_paths: List[str]=[], sim_build: Path=None, waves: bool=False, waves_dump: Path=None, waves_depth: int=0, sim: str='icarus', seed: int=0, replay: bool=False, fl_path: Path=None) -> Tuple[List[str], List[str]]:
+    results_names, results_paths = _make_make(work_dir, top_level_module, block_name, results_names, results_paths, sim_build, waves, waves_dump, waves_depth, sim, fl_path)
+    results_names, results_paths = _gen_tb(tb_dir, work_dir, block_name, simtime, test_name, sim_args, results_names, results_paths, seed, replay)
     results_names, results_paths = _get_sim_portlist(rtl_dir, top_level_module, work_dir, results_names, results_paths)
     return results_names, results_paths
 
 # 4. Run simulation 
-def run_sim(work_dir: Path, top_level_module: str, waves: bool, nococo: bool=False, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
-    # 0. Temporarly edit design to include vcd dump
-    if not nococo and waves:
-        _add_dump_vcd(work_dir, top_level_module)
-    # 1. Run makefile or icarus only
-    results_names, results_paths, failed = _run(work_dir, top_level_module, nococo, results_names, results_paths)
+def run_sim(work_dir: Path, top_level_module: str, waves: bool, nococo: bool=False, results_names: List[str]=[], results_paths: List[str]=[], sim: str='icarus', seed: int=None) -> Tuple[List[str], List[str]]:
+    # 1. Run makefile or compile only
+    results_names, results_paths, failed = _run(work_dir, top_level_module, nococo, results_names, results_paths, sim, seed)
     # 2. Open GTKWave if needed
     if not nococo and waves:
         results_names, results_paths = _wave(work_dir, results_names, results_paths)
-    # 3. Remove Dump
-    if not nococo and waves:
-        _rem_dump_vcd(work_dir, top_level_module)
     
     return results_names, results_paths, failed
 
+# simulate a single view: generate filelist, create test files and run simulation
+def sim_view(cfg_path: Path, view: str, waves: bool, simtime: int, nococo: bool, test_name: str, sim_args: List[str], jobs: int=1, waves_opts: dict={}, sim: str='icarus', native: bool=False, seed: int=None, replay: bool=False) -> Tuple[List[str], List[str], bool]:
+    results_names, results_paths = [], []
+    # 1. Get descriptor from configuraiton file
+    ws_path, project_name, block_name, rtl_dir, tb_dir, work_dir = gen_get_descriptor(cfg_path, view)
+    # 2. Generate filelist
+    results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True, results_names, results_paths, jobs=jobs)
+    # 3. Find top-level-module
+    top_level_module = get_top_level_path(cfg_path, view).stem
+    # Random seed, reported so that the run can be reproduced
+    if seed is None:
+        seed = random.getrandbits(31)
+    if not nococo and not replay:
+        gen_note(f'simulation seed is {seed}, use --seed {seed} to reproduce this run')
+    # 4-5. Native smoke mode: generate, build and run a C++ harness
+    if native:
+        results_names, results_paths = _get_sim_portlist(rtl_dir, top_level_module, work_dir, results_names, results_paths)
+        wrapper_path, harness_path = _gen_native(work_dir, top_level_module, rtl_dir)
+        return _run_native(work_dir, wrapper_path, harness_path, simtime, seed, results_names, results_paths)
+    # 4. Create test files: makefile and testbench, the design is compiled into a shared compile cache
+    if not nococo:
+        waves_dump = _gen_waves_dump(work_dir, top_level_module, rtl_dir, **waves_opts) if waves and get_backend(sim).dump_module else None
+        if waves and not waves_dump and any(waves_opts.get(opt) for opt in ['scopes', 'start', 'stop']):
+            gen_note(f'waves window and scope selection are not supported by {sim}, the whole run is traced')
+        make_lines = get_backend(sim).get_make_lines(waves, waves_dump, waves_opts.get('depth', 0))
+        sim_build = get_sim_build(work_dir, top_level_module, sim, [waves_dump] if waves_dump else [], make_lines)
+        results_names, results_paths = create_test(tb_dir, work_dir, top_level_module, rtl_dir, block_name, simtime, test_name, sim_args, results_names, results_paths, sim_build, waves, waves_dump, waves_opts.get('depth', 0), sim, seed, replay)
+    # 5. Run simulation
+    results_names, results_paths, failed = run_sim(work_dir, top_level_module, waves, nococo, results_names, results_paths, sim, seed)
+    return results_names, results_paths, failed
+
+# process pool worker: simulate a single view with all of its output redirected to a log file
+def _sim_view_worker(log_path: Path, *args) -> Tuple[List[str], List[str], bool]:
+    
+    # redirect stdout and stderr file descriptors, so that tool subprocesses are logged as well
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved_fds = (os.dup(1), os.dup(2))
+    with open(log_path, 'w') as log:
+        os.dup2(log.fileno(), 1)
+        os.dup2(log.fileno(), 2)
+        try:
+            results_names, results_paths, failed = sim_view(*args)
+        except SystemExit:
+            results_names, results_paths, failed = [], [], True
+        except Exception:
+            traceback.print_exc()
+            results_names, results_paths, failed = [], [], True
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved_fds[0], 1)
+            os.dup2(saved_fds[1], 2)
+            os.close(saved_fds[0])
+            os.close(saved_fds[1])
+    
+    return results_names, results_paths, failed
+
+# print a live progress line
+def _print_progress(label: str, done: int, total: int, failed: int, running: List[str]) -> None:
+    line = f'\r\033[KVERI-ENV {label}: {done}/{total} done, {failed} failed'
+    if running:
+        line += f', running: {" ".join(running)}'
+    print(line, end='', flush=True)
+
+# simulate several views in a process pool, each view is logged to its own work directory
+def sim_views_parallel(cfg_path: Path, view_list: List[str], waves: bool, simtime: int, nococo: bool, test_name: str, sim_args: List[str], jobs: int, sim: str='icarus') -> None:
+    
+    # per view log files
+    log_paths = {}
+    for view in view_list:
+        work_dir = gen_get_descriptor(cfg_path, view)[5]
+        work_dir.mkdir(parents=True, exist_ok=True)
+        log_paths[view] = work_dir / 'sim.log'
+    
+    # run views, RGF generation inside each view is kept serial
+    results, failed_views = {}, []
+    with ProcessPoolExecutor(max_workers=min(jobs, len(view_list))) as pool:
+        futures = {pool.submit(_sim_view_worker, log_paths[view], cfg_path, view, waves, simtime, nococo, test_name, sim_args, 1, {}, sim): view for view in view_list}
+        pending = set(futures)
+        _print_progress('RUN-ALL', 0, len(view_list), 0, [futures[future] for future in pending if future.running()])
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                view = futures[future]
+                results[view] = future.result()
+                if results[view][2]:
+                    failed_views.append(view)
+            _print_progress('RUN-ALL', len(results), len(view_list), len(failed_views), [futures[future] for future in pending if future.running()])
+    print('')
+
+    # combined log, in view order
+    failed_views = [view for view in view_list if results[view][2]]
+    results_names, results_paths = [], []
+    for view in view_list:
+        view_names, view_paths, failed = results[view]
+        status = 'failed' if failed else 'passed'
+        results_names.append(f'{view} log ({status})')
+        results_paths.append(log_paths[view])
+        results_names += [f'{view} {name}' for name in view_names]
+        results_paths += view_paths
+    failed = len(failed_views)!=0
+    log_header = f'Run All - {len(view_list) - len(failed_views)}/{len(view_list)} Views Completed Successfully' if not failed else f'Run All - Views Failed: {" ".join(failed_views)}'
+    gen_outlog(results_names, results_paths, log_header, failed)
+
+# find the tests matching a list of names or glob patterns, a test is a file with a function named after it
+def _find_tests(tb_dir: Path, patterns: List[str]) -> List[str]:
+    tests = []
+    for pattern in patterns:
+        matched = []
+        for test_path in sorted(tb_dir.glob(f'{pattern}.py')):
+            with open(test_path, 'r') as file:
+                if re.search(r'\bdef\s+' + re.escape(test_path.stem) + r'\s*\(', file.read()):
+                    matched.append(test_path.stem)
+        if not matched:
+            gen_err(f'no test matching {pattern} found in {tb_dir}')
+        tests += [test for test in matched if test not in tests]
+    return tests
+
+# run a single test of a regression in its own work directory, returns the make return code and wall time
+def _run_regress(run_dir: Path, test_name: str, seed: int) -> Tuple[int, float]:
+    env = dict(os.environ, TESTCASE=test_name, RANDOM_SEED=str(seed))
+    start_time = time.time()
+    with open(run_dir / 'sim.log', 'w') as log:
+        output = subprocess.run(['make'], cwd=run_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return output.returncode, time.time() - start_time
+
+# merge the results.xml files of all regression runs into a single junit report
+def _merge_junit(runs: List[Tuple[str, int, Path, int, float]], block_name: str, report_path: Path) -> List[bool]:
+    suite = ET.Element('testsuite', name=block_name)
+    passed_list, total_time = [], 0.0
+    for test_name, seed, run_dir, returncode, wall_time in runs:
+        
+        # testcase per run, named after the test and seed, timed by wall time
+        case = ET.SubElement(suite, 'testcase', name=f'{test_name}[seed={seed}]', classname=test_name, time=f'{wall_time:.3f}')
+        ET.SubElement(ET.SubElement(case, 'properties'), 'property', name='seed', value=str(seed))
+        total_time += wall_time
+
+        # copy failures of the cocotb results, a missing report is a failure by itself
+        results_path = run_dir / 'results.xml'
+        passed = returncode==0
+        if not results_path.is_file():
+            ET.SubElement(case, 'failure', message=f'no results found, see {run_dir / "sim.log"}')
+            passed = False
+        else:
+            for result in ET.parse(results_path).getroot().iter('testcase'):
+                for child in result:
+                    if child.tag in ['failure', 'error', 'skipped']:
+                        case.append(child)
+                        passed = passed and child.tag=='skipped'
+            if returncode!=0 and not len(case.findall('failure')):
+                ET.SubElement(case, 'failure', message=f'make returned {returncode}, see {run_dir / "sim.log"}')
+        passed_list.append(passed)
+    
+    # suite totals
+    suite.set('tests', str(len(runs)))
+    suite.set('failures', str(passed_list.count(False)))
+    suite.set('time', f'{total_time:.3f}')
+    testsuites = ET.Element('testsuites', name='regression')
+    testsuites.append(suite)
+    ET.ElementTree(testsuites).write(report_path, encoding='UTF-8', xml_declaration=True)
+    return passed_list
+
+# run a regression: every test is run once per seed, each run in its own work directory
+def run_regression(cfg_path: Path, view: str, simtime: int, sim_args: List[str], patterns: List[str], seeds: int, jobs: int, sim: str='icarus', seed: int=None) -> None:
+    
+    # 1. Get descriptor and generate filelist once for all runs
+    ws_path, project_name, block_name, rtl_dir, tb_dir, work_dir = gen_get_descriptor(cfg_path, view)
+    getlist(ws_path, cfg_path, view, work_dir, True, [], [], jobs=jobs)
+    top_level_module = get_top_level_path(cfg_path, view).stem
+    tests = _find_tests(tb_dir, patterns)
+
+    # 2. Create test files of every run in its own work directory, all runs share the filelist of the view and a single compiled design
+    sim_build = get_sim_build(work_dir, top_level_module, sim, [], get_backend(sim).get_make_lines())
+    regress_dir = work_dir / 'regress'
+    runs = []
+    seed_rng = random.Random(seed)
+    for test_name in tests:
+        for i in range(seeds):
+            run_seed = seed_rng.getrandbits(31)
+            run_dir = regress_dir / f'{test_name}_{i}'
+            run_dir.mkdir(parents=True, exist_ok=True)
+            results_path = run_dir / 'results.xml'
+            if results_path.is_file():
+                os.remove(results_path)
+            create_test(tb_dir, run_dir, top_level_module, rtl_dir, block_name, simtime, test_name, sim_args, [], [], sim_build, sim=sim, fl_path=work_dir / 'design.fl')
+            runs.append((test_name, run_seed, run_dir))
+    
+    # compile once before the runs start, so that runs do not race on the compile cache
+    if not _compile(runs[0][2], sim_build, sim):
+        gen_err(f'compilation of {top_level_module} into {sim_build} failed')
+
+    # 3. Run on a worker pool, simulations are subprocesses so threads are enough
+    gen_note(f'running {len(runs)} regression runs over {min(jobs, len(runs))} workers')
+    outcomes = {}
+    with ThreadPoolExecutor(max_workers=min(jobs, len(runs))) as pool:
+        futures = {pool.submit(_run_regress, run_dir, test_name, seed): i for i, (test_name, seed, run_dir) in enumerate(runs)}
+        pending, failed_runs = set(futures), 0
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcomes[futures[future]] = future.result()
+                failed_runs += outcomes[futures[future]][0]!=0
+            _print_progress('REGRESS', len(outcomes), len(runs), failed_runs, [])
+    print('')
+
+    # 4. Merge results to a single junit report
+    report_path = regress_dir / 'results.xml'
+    passed_list = _merge_junit([run + outcomes[i] for i, run in enumerate(runs)], block_name, report_path)
+    
+    # 5. Print log
+    results_names, results_paths = ['regression report'], [report_path]
+    for (test_name, seed, run_dir), passed, i in zip(runs, passed_list, range(len(runs))):
+        status = 'passed' if passed else 'failed'
+        results_names.append(f'{test_name} seed {seed} ({status}, {outcomes[i][1]:.1f}s) log')
+        results_paths.append(run_dir / 'sim.log')
+    failed = not all(passed_list)
+    log_header = f'View {view} - Regression: {passed_list.count(True)}/{len(runs)} Runs Passed'
+    gen_outlog(results_names, results_paths, log_header, failed)
+
 ############################
 ###                      ###
 ### sim.py main function ###
@@ -501,21 +943,19 @@ def run_sim(work_dir: Path, top_level_module: str, waves: bool, nococo: bool=Fal
 
 def main() -> None:
     # 0. Parse user arguments
-    cfg_path, view_list, waves, simtime, nococo, test_name, sim_args = parse_args()
+    cfg_path, view_list, waves, waves_opts, simtime, nococo, test_name, sim_args, jobs, regress, seeds, sim, native, seed, replay = parse_args()
+    # Regression mode
+    if regress:
+        run_regression(cfg_path, view_list[0], simtime, sim_args, regress, seeds, jobs, sim, seed)
+        return
+    # Several views with several jobs run in parallel
+    if len(view_list) > 1 and jobs > 1:
+        sim_views_parallel(cfg_path, view_list, waves, simtime, nococo, test_name, sim_args, jobs, sim)
+        return
     # Iterate over all views in view list:
     for view in view_list:
-        results_names, results_paths = [], []
-        # 1. Get descriptor from configuraiton file
-        ws_path, project_name, block_name, rtl_dir, tb_dir, work_dir = gen_get_descriptor(cfg_path, view)
-        # 2. Generate filelist
-        results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True, results_names, results_paths)
-        # 3. Find top-level-module
-        top_level_module = get_top_level_path(cfg_path, view).stem
-        # 4. Create test files: makefile and testbench
-        if not nococo:
-            results_names, results_paths = create_test(tb_dir, work_dir, top_level_module, rtl_dir, block_name, simtime, test_name, sim_args, results_names, results_paths)
-        # 5. Run simulation
-        results_names, results_paths, failed = run_sim(work_dir, top_level_module, waves, nococo, results_names, results_paths)
+        # 1-5. Simulate view
+        results_names, results_paths, failed = sim_view(cfg_path, view, waves, simtime, nococo, test_name, sim_args, jobs, waves_opts, sim, native, seed, replay)
         # 6. Print log
         log_header = f'View {view} - Simulation Completed Successfully' if not failed else f'View {view} - Simulation Failed'
         gen_outlog(results_names, results_paths, log_header, failed)
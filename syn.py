@@ -30,6 +30,7 @@ def parse_args():
     # view name - a must
     parser.add_argument('-v', '--view', type=str, action='store', dest='view', help='Desired view, "show" to display options', required=False)
     # optional triggers
+    parser.add_argument('-j', '--jobs', type=int, action='store', dest='jobs', help='Number of parallel workers, defaults to 1', default=1)
     parser.add_argument('--show', action='store_true', dest='show', help='Show synthesis output using graphviz', default=False)
 
     # get arguments
@@ -44,7 +45,7 @@ def parse_args():
     elif args.view=='show':
         show_views(cfg_path)
         
-    return cfg_path, args.view, args.show
+    return cfg_path, args.view, args.show, args.jobs
 
 # convert code to verilog, remove sv constructs 
 def _sv2v(work_dir: Path):
@@ -142,11 +143,11 @@ def _run_syn(work_dir: Path, script_path: Path, output_path: Path, results_names
 
 def main() -> None:
     # 0. Parse user arguments
-    cfg_path, view, show = parse_args()
+    cfg_path, view, show, jobs = parse_args()
     # 1. Get descriptor from configuraiton file
     ws_path, _, block_name, _, _, work_dir = gen_get_descriptor(cfg_path, view)
     # 2. Generate filelist
-    results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True)
+    results_names, results_paths = getlist(ws_path, cfg_path, view, work_dir, True, jobs=jobs)
     # 3. Find top level module
     top_level_module = get_top_level_path(cfg_path, view).stem
     # 4. Pre-process Systemverilog code
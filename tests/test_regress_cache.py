@@ -0,0 +1,67 @@
+import os
+import shutil
+import subprocess
+from pathlib import Path
+import pytest
+import sim
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+TEST_NAME = 'smoke_test'
+
+# stand-in for make, applies the compile rule of cocotb's Makefile.icarus to the generated makefile
+class FakeMake(object):
+    def __init__(self):
+        self.builds = []
+
+    def __call__(self, command, cwd=None, **kwargs):
+        cwd = Path(cwd)
+        with open(cwd / 'makefile', 'r') as make_file:
+            lines = [line.split('=', 1) for line in make_file.read().splitlines() if '=' in line]
+        variables = {}
+        for name, value in lines:
+            variables.setdefault(name.rstrip('+ ').strip(), []).append(value.strip())
+        target = Path(variables['SIM_BUILD'][0]) / 'sim.vvp'
+        prerequisites = [Path(path) for path in variables['VERILOG_SOURCES'] + variables['CUSTOM_COMPILE_DEPS']]
+
+        # $(SIM_BUILD)/sim.vvp: $(VERILOG_SOURCES) $(CUSTOM_COMPILE_DEPS)
+        if not target.is_file() or any(os.stat(path).st_mtime_ns > os.stat(target).st_mtime_ns for path in prerequisites):
+            self.builds.append(cwd)
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text('compiled')
+
+        # a plain make also runs the test
+        if command == ['make']:
+            (cwd / 'results.xml').write_text('<testsuites><testsuite><testcase name="smoke_test"/></testsuite></testsuites>')
+        return subprocess.CompletedProcess(command, 0)
+
+@pytest.fixture
+def cfg_path(tmp_path, monkeypatch):
+    ws_path = tmp_path / 'example_ws'
+    shutil.copytree(REPO_DIR / 'examples' / 'example_ws', ws_path)
+    tb_dir = ws_path / 'example_project' / 'verification' / 'apb_fifo' / 'tests'
+    (tb_dir / f'{TEST_NAME}.py').write_text(f'import cocotb\n\n@cocotb.test()\nasync def {TEST_NAME}(dut):\n    pass\n')
+    monkeypatch.setenv('tools_dir', str(REPO_DIR))
+    monkeypatch.setenv('work_dir', str(tmp_path / 'work'))
+    monkeypatch.setenv('home_dir', str(tmp_path))
+    monkeypatch.setenv('rls_dir', str(tmp_path / 'rls'))
+    return ws_path / 'example_project' / 'design' / 'apb_fifo' / 'misc' / 'apb_fifo.cfg'
+
+# a second regression of an unchanged view reuses the compiled design in every run
+def test_regression_does_not_rebuild(cfg_path, monkeypatch):
+    fake_make = FakeMake()
+    monkeypatch.setattr(sim.subprocess, 'run', fake_make)
+    sim.run_regression(cfg_path, 'rtl', 100, [], [TEST_NAME], 2, 2)
+    assert len(fake_make.builds) == 1
+    sim.run_regression(cfg_path, 'rtl', 100, [], [TEST_NAME], 2, 2)
+    assert len(fake_make.builds) == 1
+
+# editing a source recompiles the design in place, the compile cache does not grow
+def test_regression_recompiles_in_place(cfg_path, monkeypatch, tmp_path):
+    fake_make = FakeMake()
+    monkeypatch.setattr(sim.subprocess, 'run', fake_make)
+    sim.run_regression(cfg_path, 'rtl', 100, [], [TEST_NAME], 1, 1)
+    source_path = cfg_path.parent.parent / 'rtl' / 'apb_fifo_top.v'
+    os.utime(source_path)
+    sim.run_regression(cfg_path, 'rtl', 100, [], [TEST_NAME], 1, 1)
+    assert len(fake_make.builds) == 2
+    assert len(list((tmp_path / 'work' / 'sim_cache').iterdir())) == 1
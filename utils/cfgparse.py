@@ -1,14 +1,67 @@
 import os
 from pathlib import Path
 import configparser
-from typing import Tuple, List
+from typing import Tuple, List, Dict
 from utils.general import gen_err
 from utils.general import gen_note
 from utils.general import gen_validate_path
 
+# sections that are not views
+RESERVED_SECTIONS = ['general', 'path', 'DEFAULT']
+
+# Parsed configuration file, sections are split once and queries are memoized
+class CfgNode(object):
+    def __init__(self, cfg_path: Path, mtime: float):
+        self.cfg_path = cfg_path # path to configuration file
+        self.mtime = mtime # modification time of configuration file when parsed
+        self.config = configparser.ConfigParser()
+        self.config.read(cfg_path)
+        self.views = [sect for sect in self.config if sect not in RESERVED_SECTIONS] # list of views in configuration
+        self.block_path = cfg_path.parent.parent # block directory
+        self._sect_cache = {} # (section, view, only_keys) --> (keys, values)
+        self._query_cache = {} # (query, args) --> result
+
+    # memoize a query on this node
+    def query(self, name: str, func, *args):
+        key = (name,) + args
+        if key not in self._query_cache:
+            self._query_cache[key] = func(self, *args)
+        return self._query_cache[key]
+
+# Process-wide cache of parsed configuration files, keyed by path and mtime
+class ConfigGraph(object):
+    def __init__(self):
+        self.nodes: Dict[Path, CfgNode] = {}
+    
+    # get parsed configuration file, re-parse only if it changed on disk
+    def get_node(self, cfg_path: Path) -> CfgNode:
+        cfg_path = Path(cfg_path)
+        try:
+            mtime = cfg_path.stat().st_mtime
+        except OSError:
+            mtime = None
+        node = self.nodes.get(cfg_path)
+        if node is None or node.mtime != mtime:
+            node = CfgNode(cfg_path, mtime)
+            self.nodes[cfg_path] = node
+        return node
+    
+    # drop all cached configuration files
+    def clear(self) -> None:
+        self.nodes.clear()
+
+cfg_graph = ConfigGraph()
 
 # parses a given section in a given configuration file. view name and keys are optional 
-def _parse_sect(config: configparser, section_name: str, view_name: str=None, only_keys: bool=False, required=True)-> Tuple[List[str], List[str]]:
+def _parse_sect(node: CfgNode, section_name: str, view_name: str=None, only_keys: bool=False, required=True)-> Tuple[List[str], List[str]]:
+    
+    # return cached result if this section was already parsed
+    cache_key = (section_name, view_name, only_keys)
+    if cache_key in node._sect_cache:
+        keys, values = node._sect_cache[cache_key]
+        return list(keys), list(values)
+
+    config = node.config
     keys, values = [], []
 
     # handle general sections placed outside of view scopes
@@ -74,48 +127,50 @@ def _parse_sect(config: configparser, section_name: str, view_name: str=None, on
                 keys.append(key)
                 values.append(value)
 
-    return keys, values
+    # store parsed section
+    node._sect_cache[cache_key] = (keys, values)
+
+    return list(keys), list(values)
     
 # Parses 'file' under a given view and returns a list of files
-def _get_files(config: configparser, view: str, cfg_path: Path) -> List[Path]:
+def _get_files(node: CfgNode, view: str) -> List[Path]:
     
     # parse files partial paths from configuration
-    files, _ = _parse_sect(config, 'file', view ,True, False)
+    files, _ = _parse_sect(node, 'file', view ,True, False)
     
     # infer files full paths
     files_paths = []
-    block_path = cfg_path.parent.parent
     for file in files:
-        file_path = block_path / Path(file)
+        file_path = node.block_path / Path(file)
         gen_validate_path(file_path, 'build a filelist due to a missing file')
         files_paths.append(file_path)
     
     return files_paths
 
-def _get_defines(config: configparser, view: str) -> List[str]:
+def _get_defines(node: CfgNode, view: str) -> List[str]:
 
     # parse defines
-    defines, _ = _parse_sect(config, 'define', view, True, False)
+    defines, _ = _parse_sect(node, 'define', view, True, False)
     return defines
 
-def _get_regs(config: configparser, view: str, cfg_path: Path) -> List[Path]:
+def _get_regs(node: CfgNode, view: str) -> List[Path]:
     regs_full_paths = []
     # parse 'regs' section
-    regs_paths, _ = _parse_sect(config, 'regs', view, True, False)
+    regs_paths, _ = _parse_sect(node, 'regs', view, True, False)
 
     # validate paths
     for reg_path in regs_paths:
-        reg_full_path = cfg_path.parent.parent / reg_path
+        reg_full_path = node.block_path / reg_path
         gen_validate_path(reg_full_path, 'locate regs file while generating filelist')
         regs_full_paths.append(reg_full_path)
     
     return regs_full_paths
     
 # Parses 'child' section in view and returns lists of child names, paths to cfgs and view names
-def _get_children(config: configparser, view: str, child_names: List[str], child_paths: List[Path]) -> Tuple[List[str], List[Path], List[str]]:
+def _get_children(node: CfgNode, view: str, child_names: List[str], child_paths: List[Path]) -> Tuple[List[str], List[Path], List[str]]:
     
     # parse 'child' section in configuration file
-    new_names, new_views = _parse_sect(config, 'child', view, False, False)
+    new_names, new_views = _parse_sect(node, 'child', view, False, False)
     
     # locate paths in given path list
     new_paths = []
@@ -173,23 +228,28 @@ def _get_child_cfg_path(papa_cfg_path: Path, ws_path: Path, child_name: str, chi
     return cfg_path
 
 # parses 'path' section and returns names and paths of valid childs
-def _get_paths(ws_path: Path, config: configparser, cfg_path: Path, release=False) -> Tuple[List[str], List[Path]]:
+def _get_paths(node: CfgNode, ws_path: Path, release=False) -> Tuple[List[str], List[Path]]:
     
     # parse 'path' section
-    children, locations = _parse_sect(config, 'path', None, False, False)
+    children, locations = _parse_sect(node, 'path', None, False, False)
     
     # infer path to children configuration paths
     paths = []
     for i, child in enumerate(children):
-        paths.append(_get_child_cfg_path(cfg_path, ws_path, child, locations[i], release))
+        paths.append(_get_child_cfg_path(node.cfg_path, ws_path, child, locations[i], release))
         
     return children, paths
 
+# get children names, configuration paths and views of a given view
+def _get_view_children(node: CfgNode, ws_path: Path, view: str, release=False) -> Tuple[List[str], List[Path], List[str]]:
+    names, paths = _get_paths(node, ws_path, release)
+    return _get_children(node, view, names, paths)
+
 # get design values
-def _get_design(cfg: configparser, view: str) -> str:
+def _get_design(node: CfgNode, view: str) -> str:
     
     # parse design section
-    keys, values = _parse_sect(cfg, 'design', view, False, True)
+    keys, values = _parse_sect(node, 'design', view, False, True)
 
     # handle top level definition
     for i, key in enumerate(keys):
@@ -198,34 +258,17 @@ def _get_design(cfg: configparser, view: str) -> str:
             top_level_name = values[i]
             return top_level_name
     
-    # throw an error if no top leve was found
-    if not top_level_name:
-        gen_err(f'top module definition was not found under "design" section, use the following syntax\n\ttop=TOP_MODULE_NAME', 2)
-     
-def get_top_rgf_path(cfg_path: Path, view: str) -> Path:
+    # throw an error if no top level was found
+    gen_err(f'top module definition was not found under "design" section, use the following syntax\n\ttop=TOP_MODULE_NAME', 2)
 
-    # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
-
-    # get RGF path
-    paths_list = _get_regs(cfg, view, cfg_path)
-    if len(paths_list)!=1:
-        gen_err(f'found to many RGFs in view {view}: {paths_list}')
-    
-    return paths_list[0]
-
-def get_top_level_path(cfg_path: Path, view: str) -> Path:
-
-    # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
+# find top level module path within the view's files
+def _get_top_level_path(node: CfgNode, view: str) -> Path:
 
     # get top level
-    top_level_name = _get_design(cfg, view)
+    top_level_name = _get_design(node, view)
 
     # get files
-    files = _get_files(cfg, view, cfg_path)
+    files = node.query('files', _get_files, view)
 
     # find module with stem that matches top level name
     module_names = []
@@ -236,57 +279,93 @@ def get_top_level_path(cfg_path: Path, view: str) -> Path:
     top_level_path = files[module_names.index(top_level_name)]
 
     return top_level_path
+     
+def get_top_rgf_path(cfg_path: Path, view: str) -> Path:
 
-# parses through a config file, getting entire file list from all children
-def parse_cfg_rec(ws_path: Path, cfg_path: Path, view: str, file_list: List[Path] = [], defines_list: List[str] = [], regs_list=[], release=False) -> Tuple[List[Path], List[str], List[Path]]:
-    
     # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
+    node = cfg_graph.get_node(cfg_path)
 
-    # get children names paths and views
-    names, paths = _get_paths(ws_path, cfg, cfg_path, release)
-    names, paths, views = _get_children(cfg, view, names, paths)
-
-    # not done yet, go over children names and re-call recurssion
-    if names:
-        for i,_ in enumerate(names):
-            # for every children in list re-call this function
-            additional_files, additional_defines, additional_regs = parse_cfg_rec(ws_path, paths[i], views[i], file_list, defines_list, regs_list, release)
-            file_list += additional_files
-            defines_list += additional_defines
-            regs_list += additional_regs
+    # get RGF path
+    paths_list = node.query('regs', _get_regs, view)
+    if len(paths_list)!=1:
+        gen_err(f'found to many RGFs in view {view}: {paths_list}')
     
-    # append current files and defines
-    file_list += _get_files(cfg, view, cfg_path)
-    defines_list += _get_defines(cfg, view)
-    regs_list += _get_regs(cfg, view, cfg_path)
+    return paths_list[0]
+
+def get_top_level_path(cfg_path: Path, view: str) -> Path:
+
+    # read configuration file
+    node = cfg_graph.get_node(cfg_path)
+
+    return node.query('top', _get_top_level_path, view)
+
+# resolve the (cfg, view) hierarchy as a DAG, returns unique nodes with children before parents
+def resolve_hierarchy(ws_path: Path, cfg_path: Path, view: str, release=False) -> List[Tuple[Path, str]]:
+    order, done, stack = [], set(), []
+
+    # depth first walk, each (cfg, view) pair is expanded once
+    def visit(node_path: Path, node_view: str) -> None:
+        key = (node_path, node_view)
+        if key in done:
+            return
+        if key in stack:
+            cycle = stack[stack.index(key):] + [key]
+            cycle_str = ' -> '.join(f'{p.stem}:{v}' for p, v in cycle)
+            gen_err(f'found a cycle in configuration hierarchy: {cycle_str}', 2)
+        stack.append(key)
+        node = cfg_graph.get_node(node_path)
+        _, paths, views = node.query('children', _get_view_children, ws_path, node_view, release)
+        for i, child_path in enumerate(paths):
+            visit(child_path, views[i])
+        stack.pop()
+        done.add(key)
+        order.append(key)
+
+    visit(Path(cfg_path), view)
+    return order
+
+# parses through a config file, getting entire file list from all children
+def parse_cfg_rec(ws_path: Path, cfg_path: Path, view: str, release=False) -> Tuple[List[Path], List[str], List[Path]]:
+    file_list, defines_list, regs_list = [], [], []
+    seen_files, seen_defines, seen_regs = set(), set(), set()
+
+    # collect files, defines and regs of each unique node in topological order
+    for node_path, node_view in resolve_hierarchy(ws_path, cfg_path, view, release):
+        node = cfg_graph.get_node(node_path)
+        for file in node.query('files', _get_files, node_view):
+            if file not in seen_files:
+                seen_files.add(file)
+                file_list.append(file)
+        for define in node.query('defines', _get_defines, node_view):
+            if define not in seen_defines:
+                seen_defines.add(define)
+                defines_list.append(define)
+        for reg in node.query('regs', _get_regs, node_view):
+            if reg not in seen_regs:
+                seen_regs.add(reg)
+                regs_list.append(reg)
         
-    return list(set(file_list)), list(set(defines_list)), list(set(regs_list))
+    return file_list, defines_list, regs_list
 
 def parse_children(ws_path: Path, cfg_path: Path, view: str)-> Tuple[List[str], List[Path], List[str]]:
     
     # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
+    node = cfg_graph.get_node(cfg_path)
 
     # get children names paths and views
-    names, paths = _get_paths(ws_path, cfg, cfg_path)
-    names, paths, views = _get_children(cfg, view, names, paths)
+    names, paths, views = node.query('children', _get_view_children, ws_path, view, False)
 
-    return names, paths, views
+    return list(names), list(paths), list(views)
 
 def show_views(cfg_path: Path)-> None:
     
     # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
+    node = cfg_graph.get_node(cfg_path)
 
     message = 'available views:\n'
 
-    for view in cfg:
-        if view!='general' and view!='path' and view!='DEFAULT': # those are not actually views
-            message += f'{view}\n'
+    for view in node.views:
+        message += f'{view}\n'
     
     gen_note(message)
     exit(0)
@@ -294,13 +373,6 @@ def show_views(cfg_path: Path)-> None:
 def get_views(cfg_path: Path)-> List[str]:
     
     # read configuration file
-    cfg = configparser.ConfigParser()
-    cfg.read(cfg_path)
+    node = cfg_graph.get_node(cfg_path)
 
-    view_list = []
-
-    for view in cfg:
-        if view!='general' and view!='path' and view!='DEFAULT': # those are not actually views
-            view_list.append(view)
-    
-    return view_list
\ No newline at end of file
+    return list(node.views)
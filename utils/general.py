@@ -29,6 +29,28 @@ def gen_validate_path(path: Path, what_failed: str='', is_dir: bool=False) -> No
     if not is_dir and not path.is_file():
         gen_err(f'file {path} does not exist, failed to {what_failed}')
 
+# Write content to a file through a temporary file and a rename, readers never see a partial file
+def gen_write_atomic(path: Path, content: str) -> None:
+    temp_path = Path(f'{path}.{os.getpid()}.tmp')
+    try:
+        with open(temp_path, 'w') as file:
+            file.write(content)
+        os.replace(temp_path, path)
+    finally:
+        if temp_path.exists():
+            os.remove(temp_path)
+
+# Write content to a file only if it differs from the current content, keeps the modification time of unchanged files
+def gen_write_if_changed(path: Path, content: str) -> bool:
+    try:
+        with open(path, 'r') as file:
+            if file.read()==content:
+                return False
+    except OSError:
+        pass
+    gen_write_atomic(path, content)
+    return True
+
 # return path which is a parent of src_path and the first child of root
 def gen_search_parent(src_path: Path, root: Path) -> Path:
     if root not in src_path.parents:
@@ -1,20 +1,28 @@
-import subprocess
+import json
+import os
+import time
 from pathlib import Path
-from typing import List, Tuple
-from utils.general import gen_err
+from typing import List, Tuple, Dict
 from utils.general import gen_note
 from utils.general import gen_validate_path
+from utils.general import gen_write_if_changed
+from utils.general import gen_write_atomic
 from utils.cfgparse import parse_cfg_rec
+from utils.cfgparse import resolve_hierarchy
+from utils.rgfgen import write_rgfs_outputs
+from utils.rgfgen import get_generator_files
+
+MANIFEST_NAME = 'getlist_manifest.json'
+MANIFEST_VERSION = 1
 
 
 # Generates a .fl file list in the desired location
 def _gen_fl(work_dir: Path, file_list: List[Path], results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
     
     # write filelist to target location
+    # unchanged filelists keep their modification time
     fl_path = work_dir / Path('design.fl')
-    with open(fl_path, 'w') as fl:
-        for file in file_list:
-            fl.write(str(file)+'\n')
+    gen_write_if_changed(fl_path, ''.join(str(file)+'\n' for file in file_list))
     
     gen_note(f'generated a file list at {fl_path}')
 
@@ -26,61 +34,111 @@ def _gen_fl(work_dir: Path, file_list: List[Path], results_names: List[str]=[],
 # build defines file
 def build_defines_file(defines_list: List[str], work_dir: Path, file_list: List[Path]) -> List[Path]:
     defines_path = work_dir / 'defs.v'
-    with open(defines_path, 'w') as file:
-        for define in defines_list:
-            file.write(f'`define {define}\n')
+    gen_write_if_changed(defines_path, ''.join(f'`define {define}\n' for define in defines_list))
     gen_note(f'generated a defines file in {defines_path}')
     file_list.insert(0, defines_path)
     return file_list
 
 # build verilog register files
-def build_verilog_rgfs(regs_list: List[Path], work_dir: Path, file_list: List[Path]) -> List[Path]:
+def build_verilog_rgfs(regs_list: List[Path], work_dir: Path, file_list: List[Path], isolate: bool=False, jobs: int=1) -> List[Path]:
 
     # create a regen directory within workdir if it does not exist
     rgfs_dir = work_dir / 'regen' 
-    temp_path = rgfs_dir / 'temp_rgf.py'
     rgfs_dir.mkdir(parents=True, exist_ok=True)
 
-    # for each RGF:
+    # each RGF is written to its own file in rgfs dir
+    rgf_requests = []
     for rgf_path in regs_list:
-        
-        # read RGF description from file
-        with open(rgf_path, 'r') as rgf_file:
-            rgf_content = rgf_file.read()
-        
-        # Add to RGF content a write to rgfs dir
-        rgf_name = rgf_path.stem
-        rgf_path = rgfs_dir / f'{rgf_name}.v'
-        rgf_content += f'''
-verilog = {rgf_name}.get_verilog()
-with open('{rgf_path}', 'w') as verilog_file:
-    verilog_file.write(verilog)
-        '''
-
-        # Write RGF content to temp.py
-        with open(temp_path, 'w') as temp_file:
-            temp_file.write(rgf_content)
-        
-        # Run temp.py
-        try:
-            subprocess.run(['python3', f'{temp_path}'])
-        except:
-            gen_err(f'failed to run {temp_path}')
-        gen_note(f'generated verilog code for RGF {rgf_name} at {rgf_path}')
-        
-        # Append newly generated verilog to filelist
-        file_list.append(rgf_path)
+        rgf_requests.append((rgf_path, [('verilog', rgfs_dir / f'{rgf_path.stem}.v', 'w')]))
+
+    # Generate verilog from RGF descriptions, RGFs are independent so they may run in parallel
+    write_rgfs_outputs(rgf_requests, isolate, jobs)
+    
+    # Append newly generated verilog to filelist
+    for rgf_path, [(_, verilog_path, _)] in rgf_requests:
+        gen_note(f'generated verilog code for RGF {rgf_path.stem} at {verilog_path}')
+        file_list.append(verilog_path)
 
     return file_list
 
+# Get a fingerprint of a list of files, (mtime, size) per file, None for missing files
+def get_fingerprint(paths: List[Path]) -> Dict[str, List[int]]:
+    fingerprint = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            fingerprint[str(path)] = [stat.st_mtime_ns, stat.st_size]
+        except OSError:
+            fingerprint[str(path)] = None
+    return fingerprint
+
+# Check whether the manifest in work_dir is valid for the given request, returns the file list if it is
+def _check_manifest(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, create_file: bool) -> List[Path]:
+    manifest_path = work_dir / MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+    except (OSError, ValueError):
+        return None
+
+    # request must match
+    request = [MANIFEST_VERSION, str(ws_path), str(cfg_path), view, os.environ.get('rls_dir', '')]
+    if manifest.get('request') != request:
+        return None
+
+    # all outputs must still exist
+    outputs = manifest['outputs'] + ([str(work_dir / 'design.fl')] if create_file else [])
+    for output in outputs:
+        if not os.path.isfile(output):
+            return None
+
+    # all dependencies must be untouched
+    dependencies = manifest['dependencies']
+    if get_fingerprint(list(dependencies.keys())) != dependencies:
+        return None
+
+    return [Path(file) for file in manifest['file_list']]
+
+# Write a manifest of the dependencies and outputs of this getlist run
+# dependencies is a fingerprint taken before generation, so that sources edited during the run are detected next time
+def _write_manifest(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, dependencies: Dict[str, List[int]], outputs: List[Path], file_list: List[Path]) -> None:
+    manifest = {
+        'request': [MANIFEST_VERSION, str(ws_path), str(cfg_path), view, os.environ.get('rls_dir', '')],
+        'dependencies': dependencies,
+        'outputs': [str(output) for output in outputs],
+        'file_list': [str(file) for file in file_list]
+    }
+    gen_write_atomic(work_dir / MANIFEST_NAME, json.dumps(manifest, indent=4))
+
 # Generates a file list
-def getlist(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, create_file: bool=False, results_names: List[str]=[], results_paths: List[str]=[]) -> Tuple[List[str], List[str]]:
+def getlist(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, create_file: bool=False, results_names: List[str]=[], results_paths: List[str]=[], use_cache: bool=True, isolate_rgfs: bool=False, jobs: int=1) -> Tuple[List[str], List[str]]:
 
     # generating a filelist is always first in line, create workdir
     work_dir.mkdir(parents=True, exist_ok=True)
 
-    # get filelist
-    file_list, defines_list, regs_list = parse_cfg_rec(ws_path, cfg_path, view, [], [], [])
+    # skip resolution and generation if nothing changed since last run
+    if use_cache:
+        file_list = _check_manifest(ws_path, cfg_path, view, work_dir, create_file)
+        if file_list is not None:
+            gen_note(f'file list in {work_dir} is up to date, skipping generation')
+            if create_file:
+                results_names.append('filelist')
+                results_paths.append(work_dir / Path('design.fl'))
+            return results_names, results_paths
+
+    # get filelist, files modified from this point on are not recorded as up to date
+    start_ns = time.time_ns()
+    file_list, defines_list, regs_list = parse_cfg_rec(ws_path, cfg_path, view)
+    cfg_list = [node_path for node_path, _ in resolve_hierarchy(ws_path, cfg_path, view)]
+    dependencies = cfg_list + regs_list + list(file_list)
+    if regs_list:
+        dependencies += get_generator_files()
+
+    # fingerprint dependencies before generation, files modified since parsing started are left out to force a regeneration next time
+    fingerprint = get_fingerprint(dependencies)
+    for path, stat in fingerprint.items():
+        if stat and stat[0] >= start_ns:
+            fingerprint[path] = None
     
     # resolve paths to full path version
     for i in range(len(file_list)):
@@ -90,7 +148,7 @@ def getlist(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, create_fil
     file_list = build_defines_file(defines_list, work_dir, file_list)
 
     # Create verilog files from python descriptors
-    file_list = build_verilog_rgfs(regs_list, work_dir, file_list)
+    file_list = build_verilog_rgfs(regs_list, work_dir, file_list, isolate_rgfs, jobs)
 
     # remove duplicates
     seen = set()
@@ -100,4 +158,8 @@ def getlist(ws_path: Path, cfg_path: Path, view: str, work_dir: Path, create_fil
     if create_file:
         results_names, results_paths = _gen_fl(work_dir, file_list, results_names, results_paths)
     
+    # Record dependencies and generated files for next run
+    outputs = [work_dir / 'defs.v'] + [work_dir / 'regen' / f'{rgf_path.stem}.v' for rgf_path in regs_list]
+    _write_manifest(ws_path, cfg_path, view, work_dir, fingerprint, outputs, file_list)
+
     return results_names, results_paths
@@ -0,0 +1,188 @@
+import sys
+import os
+import json
+import shutil
+import filecmp
+import tempfile
+import hashlib
+import subprocess
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Dict, Tuple
+from utils.general import gen_err
+from utils.general import gen_write_atomic
+
+# output kinds an RGF can be rendered to
+RGF_OUTPUT_KINDS = ['verilog', 'json', 'html', 'inst']
+
+# number of cached versions kept per RGF, older versions are removed from the cache
+RGF_CACHE_KEEP = 4
+
+# digest of the generator files, computed once per process
+_generator_digest = None
+
+# Generator files that RGF outputs depend on
+def get_generator_files() -> List[Path]:
+    tools_dir = Path(os.environ['tools_dir'])
+    regen_dir = tools_dir / 'regen'
+    return [regen_dir / 'reg_classes.py', regen_dir / 'register_template.v', regen_dir / 'rgf_template.v', regen_dir / 'rgf_inst_template.v', tools_dir / 'utils' / 'rgfgen.py']
+
+# Directory of cached RGF artifacts, one sub-directory per RGF key
+def get_rgf_cache_dir() -> Path:
+    return Path(os.environ['work_dir']) / 'regen_cache'
+
+# Remove all but the most recently used cached versions of an RGF, entries are named <rgf name>-<key>
+def _prune_rgf_cache(rgf_name: str) -> None:
+    entries = []
+    for entry in get_rgf_cache_dir().glob(f'{rgf_name}-*'):
+        try:
+            if entry.name.rsplit('-', 1)[0]==rgf_name:
+                entries.append((entry.stat().st_mtime_ns, entry))
+        except OSError:
+            continue
+    for _, entry in sorted(entries, reverse=True)[RGF_CACHE_KEEP:]:
+        shutil.rmtree(entry, ignore_errors=True)
+
+# Get a content hash of an RGF description together with the generator and template versions
+def get_rgf_key(rgf_path: Path) -> str:
+    global _generator_digest
+    if _generator_digest is None:
+        generator_hash = hashlib.sha256()
+        for path in get_generator_files():
+            with open(path, 'rb') as file:
+                generator_hash.update(file.read())
+        _generator_digest = generator_hash.hexdigest()
+    rgf_hash = hashlib.sha256()
+    rgf_hash.update(rgf_path.stem.encode())
+    with open(rgf_path, 'rb') as file:
+        rgf_hash.update(file.read())
+    rgf_hash.update(_generator_digest.encode())
+    return rgf_hash.hexdigest()
+
+# load an RGF description module into its own namespace and return the RegFile object it describes
+def load_rgf(rgf_path: Path):
+    rgf_name = rgf_path.stem
+
+    # RGF descriptions import regen from the tools directory
+    tools_dir = os.environ['tools_dir']
+    if tools_dir not in sys.path:
+        sys.path.append(tools_dir)
+
+    # execute the description in a fresh module that is never registered in sys.modules
+    spec = importlib.util.spec_from_file_location(f'_rgf_{rgf_name}', rgf_path)
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except Exception as e:
+        gen_err(f'failed to load RGF description {rgf_path}: {e}')
+
+    # the RegFile object is expected to be named after the description file
+    if not hasattr(module, rgf_name):
+        gen_err(f'RGF description {rgf_path} does not define a register file named {rgf_name}')
+    return getattr(module, rgf_name)
+
+# render an RGF object to the requested output kinds
+def render_rgf(rgf, kinds: List[str]) -> Dict[str, str]:
+    outputs = {}
+    for kind in kinds:
+        if kind=='verilog':
+            outputs[kind] = rgf.get_verilog()
+        elif kind=='json':
+            outputs[kind] = json.dumps(rgf.get_json(), indent=4)
+        elif kind=='html':
+            outputs[kind] = rgf.get_html()
+        elif kind=='inst':
+            outputs[kind] = rgf.get_inst()
+        else:
+            gen_err(f'unknown RGF output kind {kind}, supported kinds are {RGF_OUTPUT_KINDS}')
+    return outputs
+
+# render an RGF description in a separate python interpreter
+def _render_rgf_subprocess(rgf_path: Path, kinds: List[str]) -> Dict[str, str]:
+    command = [sys.executable, '-m', 'utils.rgfgen', str(rgf_path)] + kinds
+    output = subprocess.run(command, cwd=os.environ['tools_dir'], stdout=subprocess.PIPE)
+    if output.returncode!=0:
+        gen_err(f'failed to generate RGF {rgf_path}')
+
+    # rendered outputs are the last line of stdout, anything before it was printed by the description
+    return json.loads(output.stdout.decode().rstrip('\n').split('\n')[-1])
+
+# get the requested outputs of an RGF description, in-process unless isolation was requested
+def gen_rgf_outputs(rgf_path: Path, kinds: List[str], isolate: bool=False) -> Dict[str, str]:
+    if isolate:
+        return _render_rgf_subprocess(rgf_path, kinds)
+    return render_rgf(load_rgf(rgf_path), kinds)
+
+# generate RGF outputs into files named after their kind in stage_dir, verilog is streamed to disk
+def _stage_rgf_outputs(rgf_path: Path, kinds: List[str], stage_dir: Path, isolate: bool=False) -> None:
+    if isolate:
+        outputs = _render_rgf_subprocess(rgf_path, kinds)
+        for kind in kinds:
+            gen_write_atomic(stage_dir / kind, outputs[kind])
+        return
+    rgf = load_rgf(rgf_path)
+    for kind in kinds:
+        temp_path = stage_dir / f'{kind}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as file:
+            if kind=='verilog':
+                rgf.write_verilog(file)
+            else:
+                file.write(render_rgf(rgf, [kind])[kind])
+        os.replace(temp_path, stage_dir / kind)
+
+# copy a file through a temporary file and a rename, identical destinations are left untouched to keep their modification time
+def _copy_atomic(src_path: Path, dst_path: Path) -> None:
+    if dst_path.is_file() and filecmp.cmp(src_path, dst_path, shallow=False):
+        return
+    temp_path = Path(f'{dst_path}.{os.getpid()}.tmp')
+    shutil.copyfile(src_path, temp_path)
+    os.replace(temp_path, dst_path)
+
+# generate an RGF and write its outputs, requests are (kind, output file, write mode) triplets
+# outputs are reused from the RGF cache when possible and only stale kinds are generated
+def write_rgf_outputs(rgf_path: Path, requests: List[Tuple[str, Path, str]], isolate: bool=False, cache: bool=True) -> None:
+    kinds = list(dict.fromkeys(kind for kind, _, _ in requests))
+
+    # outputs are staged in the cache entry, or in a temporary directory if caching is disabled
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if cache:
+            stage_dir = get_rgf_cache_dir() / f'{rgf_path.stem}-{get_rgf_key(rgf_path)}'
+            stage_dir.mkdir(parents=True, exist_ok=True)
+            os.utime(stage_dir)
+        else:
+            stage_dir = Path(temp_dir)
+    
+        # generate stale kinds only
+        stale_kinds = [kind for kind in kinds if not (stage_dir / kind).is_file()]
+        if stale_kinds:
+            _stage_rgf_outputs(rgf_path, stale_kinds, stage_dir, isolate)
+        
+        # copy staged outputs to their destinations
+        for kind, out_file, mode in requests:
+            if mode=='a':
+                with open(stage_dir / kind, 'r') as src, open(out_file, mode) as dst:
+                    shutil.copyfileobj(src, dst)
+            else:
+                _copy_atomic(stage_dir / kind, out_file)
+
+    # the entry in use was just marked as the most recent one, so it is never pruned
+    if cache:
+        _prune_rgf_cache(rgf_path.stem)
+
+# generate several independent RGFs, fanning out over a process pool when more than one job is allowed
+def write_rgfs_outputs(rgf_requests: List[Tuple[Path, List[Tuple[str, Path, str]]]], isolate: bool=False, jobs: int=1, cache: bool=True) -> None:
+    workers = min(jobs, len(rgf_requests))
+    if workers <= 1:
+        for rgf_path, requests in rgf_requests:
+            write_rgf_outputs(rgf_path, requests, isolate, cache)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(write_rgf_outputs, rgf_path, requests, isolate, cache) for rgf_path, requests in rgf_requests]
+        for future in futures:
+            future.result()
+
+# subprocess entry point: python3 -m utils.rgfgen RGF_PATH KIND [KIND ...]
+if __name__ == '__main__':
+    outputs = render_rgf(load_rgf(Path(sys.argv[1])), sys.argv[2:])
+    print(json.dumps(outputs))
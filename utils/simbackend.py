@@ -0,0 +1,84 @@
+from abc import ABC
+from abc import abstractmethod
+from pathlib import Path
+from typing import List
+from utils.general import gen_err
+
+# name of the generated waves dump module
+WAVES_DUMP_MODULE = 'veri_env_waves_dump'
+
+# Simulator backend base class
+class SimBackend(ABC):
+    '''
+        Simulator Backend Class
+            * describes how a simulator is used by the cocotb flow (makefile lines) and by the compile only flow (command line)
+            * all backends share the filelist generated by getlist
+            * every backend defines VERI_ENV_SIM_<NAME> so the design can tell which simulator it runs on
+    '''
+    name = None
+    sim_target = None # compiled design, relative to cocotb's SIM_BUILD directory
+    dump_module = False # waves are dumped through the generated dump module, otherwise by the simulator itself
+
+    # backend specific define
+    def get_define(self) -> str:
+        return f'VERI_ENV_SIM_{self.name.upper()}'
+
+    # makefile lines, written after the filelist and before the include of cocotb's Makefile.sim
+    @abstractmethod
+    def get_make_lines(self, waves: bool=False, waves_dump: Path=None, waves_depth: int=0) -> List[str]:
+        pass
+
+    # compile only command line
+    @abstractmethod
+    def get_compile_command(self, fl_path: Path, top_level_module: str, out_path: Path) -> List[str]:
+        pass
+
+# Icarus Verilog backend
+class IcarusBackend(SimBackend):
+    '''
+        Icarus Verilog Backend
+            * timescale is set by cocotb's makefile in the cocotb flow and by the default iverilog timescale otherwise
+            * waves are dumped by the generated dump module, elaborated as an additional root, in FST format
+    '''
+    name = 'icarus'
+    sim_target = 'sim.vvp'
+    dump_module = True
+
+    def get_make_lines(self, waves: bool=False, waves_dump: Path=None, waves_depth: int=0) -> List[str]:
+        lines = [f'COMPILE_ARGS += -D{self.get_define()}']
+        if waves and waves_dump:
+            lines += [f'VERILOG_SOURCES += {Path(waves_dump).as_posix()}', f'COMPILE_ARGS += -s {WAVES_DUMP_MODULE}', 'export IVERILOG_DUMPER = fst']
+        return lines
+
+    def get_compile_command(self, fl_path: Path, top_level_module: str, out_path: Path) -> List[str]:
+        return ['iverilog', '-s', top_level_module, '-o', str(out_path), '-c', str(fl_path), '-g2012', f'-D{self.get_define()}']
+
+# Verilator backend
+class VerilatorBackend(SimBackend):
+    '''
+        Verilator Backend
+            * timescale of sources without one is set to 1ns/1ps, lint warnings are not fatal (use lint.py for linting)
+            * waves are traced by the verilated model itself in FST format, --trace-depth follows the requested waves depth
+            * tracing is enabled directly rather than through VERILATOR_TRACE, which would select VCD, cocotb's main then writes dump.fst
+    '''
+    name = 'verilator'
+    sim_target = 'Vtop'
+    dump_module = False
+
+    def get_make_lines(self, waves: bool=False, waves_dump: Path=None, waves_depth: int=0) -> List[str]:
+        lines = [f'COMPILE_ARGS += -D{self.get_define()} -Wno-fatal']
+        if waves:
+            lines += ['COMPILE_ARGS += --trace-fst' + (f' --trace-depth {waves_depth}' if waves_depth else ''), 'SIM_ARGS += --trace']
+        return lines
+
+    def get_compile_command(self, fl_path: Path, top_level_module: str, out_path: Path) -> List[str]:
+        return ['verilator', '--cc', '--build', '-Wno-fatal', '--timescale', '1ns/1ps', f'-D{self.get_define()}', '--top-module', top_level_module, '-Mdir', str(out_path), '-f', str(fl_path)]
+
+# available backends
+SIM_BACKENDS = {backend.name: backend for backend in [IcarusBackend, VerilatorBackend]}
+
+# Get a simulator backend by name
+def get_backend(name: str) -> SimBackend:
+    if name not in SIM_BACKENDS:
+        gen_err(f'unknown simulator {name}, supported simulators are {list(SIM_BACKENDS)}')
+    return SIM_BACKENDS[name]()